@@ -2,10 +2,16 @@
 
 import logging
 
+import httptools
 import uvicorn
 
 from .config import config
 
+try:
+    import uvloop
+except ImportError:  # uvloop does not support Windows
+    uvloop = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -19,16 +25,30 @@ def main():
     """Start the FastAPI server."""
     logger.info("Starting TeamSpeak Auth API server")
     logger.info(f"Server will run on {config.api_host}:{config.api_port}")
+    logger.info(f"API workers: {config.api_workers}")
+    logger.info(f"Trusted proxies: {config.trusted_proxy_ips}")
     logger.info(f"TeamSpeak server: {config.ts_host}:{config.ts_port}")
     logger.info(f"Required server groups: {config.required_server_groups}")
     logger.info(f"Cache TTL: {config.cache_ttl} seconds")
+    if uvloop is not None:
+        loop = "uvloop"
+        logger.info(f"Event loop: uvloop {uvloop.__version__}")
+    else:
+        loop = "asyncio"
+        logger.info("Event loop: asyncio (uvloop is not available)")
+    logger.info(f"HTTP parser: httptools {httptools.__version__}")
 
     # Run the FastAPI application with uvicorn
     uvicorn.run(
         "teamspeak_auth.api:app",
         host=config.api_host,
         port=config.api_port,
+        workers=config.api_workers,
         log_level="info",
+        loop=loop,
+        http="httptools",
+        proxy_headers=True,
+        forwarded_allow_ips=config.trusted_proxy_ips,
     )
 
 
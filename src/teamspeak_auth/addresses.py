@@ -0,0 +1,155 @@
+"""IP address parsing and subnet matching."""
+
+import functools
+import ipaddress
+import logging
+import socket
+from collections.abc import Iterable
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+# IPv4 addresses are keyed in their IPv4-mapped IPv6 form (::ffff:a.b.c.d), so both
+# spellings of the same client compare equal and never collide with native IPv6 keys
+_IPV4_MAPPED_PREFIX = 0xFFFF << 32
+_IPV4_MASK = 0xFFFFFFFF
+
+
+@functools.lru_cache(maxsize=config.ip_cache_size)
+def ip_to_int(ip_address: str) -> int | None:
+    """
+    Convert an IP address string into the integer key used for lookups.
+
+    Args:
+        ip_address: The IPv4 or IPv6 address to convert.
+
+    Returns:
+        The address as an integer, or None if it is not a valid IP address.
+    """
+    try:
+        packed = socket.inet_pton(socket.AF_INET, ip_address)
+        return _IPV4_MAPPED_PREFIX | int.from_bytes(packed, "big")
+    except OSError:
+        pass
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip_address), "big")
+    except OSError:
+        return None
+
+
+class SubnetTable:
+    """
+    Longest-prefix-match table for a fixed set of IP networks.
+
+    Networks are grouped by prefix length into sets of masked network keys, so
+    a lookup costs one mask and one set probe per distinct prefix length in the
+    table, however many networks it holds. IPv4 and IPv6 networks are kept in
+    separate tables and an address is only checked against its own family;
+    IPv4 lookups mask the plain 32-bit address rather than the 128-bit key.
+    Keys are those produced by ip_to_int().
+    """
+
+    def __init__(self, subnets: Iterable[str]):
+        """
+        Build the table from CIDR strings.
+
+        Invalid entries are logged and skipped.
+
+        Args:
+            subnets: Networks in CIDR notation, e.g. "192.168.1.0/24".
+        """
+        v4_networks: dict[int, set[int]] = {}
+        v6_networks: dict[int, set[int]] = {}
+        for subnet_str in subnets:
+            try:
+                network = ipaddress.ip_network(subnet_str, strict=False)
+            except ValueError as e:
+                logger.warning(f"Invalid subnet configuration '{subnet_str}': {e}")
+                continue
+
+            networks = v4_networks if network.version == 4 else v6_networks
+            networks.setdefault(network.prefixlen, set()).add(int(network.network_address))
+
+        self._v4_tables = _build_tables(v4_networks, 32)
+        self._v6_tables = _build_tables(v6_networks, 128)
+
+    def with_hosts(self, ip_keys: Iterable[int]) -> "SubnetTable":
+        """
+        Return a copy of the table that also matches the given single addresses.
+
+        The addresses are added as /32 (IPv4) or /128 (IPv6) networks, so one
+        lookup in the copy answers both "in a network" and "is one of these
+        addresses". The table itself is left unchanged.
+
+        Args:
+            ip_keys: Addresses as returned by ip_to_int().
+
+        Returns:
+            The new table.
+        """
+        v4_hosts = set()
+        v6_hosts = set()
+        for ip_key in ip_keys:
+            if ip_key >> 32 == _IPV4_MAPPED_PREFIX >> 32:
+                v4_hosts.add(ip_key & _IPV4_MASK)
+            else:
+                v6_hosts.add(ip_key)
+
+        table = object.__new__(SubnetTable)
+        table._v4_tables = _add_hosts(self._v4_tables, v4_hosts, 32)
+        table._v6_tables = _add_hosts(self._v6_tables, v6_hosts, 128)
+        return table
+
+    def __bool__(self) -> bool:
+        """Return True if the table holds at least one network."""
+        return bool(self._v4_tables or self._v6_tables)
+
+    def __contains__(self, ip_key: int | None) -> bool:
+        """
+        Check whether an address falls inside any network in the table.
+
+        Args:
+            ip_key: The address as returned by ip_to_int().
+
+        Returns:
+            True if the address is in one of the networks, False otherwise.
+        """
+        if ip_key is None:
+            return False
+        if ip_key >> 32 == _IPV4_MAPPED_PREFIX >> 32:
+            tables = self._v4_tables
+            ip_key &= _IPV4_MASK
+        else:
+            tables = self._v6_tables
+        for mask, network_keys in tables:
+            if ip_key & mask in network_keys:
+                return True
+        return False
+
+
+def _build_tables(
+    networks_by_prefixlen: dict[int, set[int]], address_bits: int
+) -> tuple[tuple[int, frozenset[int]], ...]:
+    """Return (mask, network keys) pairs, longest prefix first."""
+    return tuple(
+        (_prefix_mask(prefixlen, address_bits), frozenset(network_keys))
+        for prefixlen, network_keys in sorted(networks_by_prefixlen.items(), reverse=True)
+    )
+
+
+def _add_hosts(
+    tables: tuple[tuple[int, frozenset[int]], ...], hosts: set[int], address_bits: int
+) -> tuple[tuple[int, frozenset[int]], ...]:
+    """Return the tables with hosts merged into the full-length prefix entry."""
+    if not hosts:
+        return tables
+    host_mask = _prefix_mask(address_bits, address_bits)
+    if tables and tables[0][0] == host_mask:
+        return ((host_mask, tables[0][1] | hosts), *tables[1:])
+    return ((host_mask, frozenset(hosts)), *tables)
+
+
+def _prefix_mask(prefixlen: int, address_bits: int) -> int:
+    """Return the netmask for a prefix length."""
+    return ((1 << prefixlen) - 1) << (address_bits - prefixlen)
@@ -1,11 +1,16 @@
 """FastAPI server for authorization queries."""
 
 import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
+import anyio.to_thread
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 
 from ..auth_service import AuthorizationService
-from . import dependencies
+from ..config import config
 from .auth import router as auth_router
 from .ome import router as ome_router
 from .root import router as root_router
@@ -13,37 +18,48 @@ from .status import router as status_router
 
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Initialize the authorization service on startup and clean up on shutdown."""
+    logger.info("Starting up FastAPI application")
+
+    # Raise anyio's default limit of 40 threads used for sync endpoints and dependencies
+    anyio.to_thread.current_default_thread_limiter().total_tokens = config.api_thread_limit
+
+    # Runs once per worker process: workers share no state, so each one
+    # builds its own service and warms its own cache from TeamSpeak.
+    auth_service = AuthorizationService()
+    await auth_service.start()
+    app.state.auth_service = auth_service
+
+    logger.info("FastAPI application started")
+
+    try:
+        yield
+    finally:
+        logger.info("Shutting down FastAPI application")
+
+        await auth_service.stop()
+        del app.state.auth_service
+
+        logger.info("FastAPI application shut down")
+
+
 # Create FastAPI app
 app = FastAPI(
     title="TeamSpeak Auth API",
     description="Authorization service based on TeamSpeak server connections and permissions",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
+# Compress larger responses for clients that accept it; a low level keeps CPU cost negligible
+app.add_middleware(GZipMiddleware, minimum_size=256, compresslevel=3)
+
 # Register routers
 app.include_router(root_router)
 app.include_router(auth_router)
 app.include_router(status_router)
 app.include_router(ome_router)
-
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the authorization service on startup."""
-    logger.info("Starting up FastAPI application")
-
-    dependencies.auth_service = AuthorizationService()
-    await dependencies.auth_service.start()
-
-    logger.info("FastAPI application started")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on shutdown."""
-    logger.info("Shutting down FastAPI application")
-
-    if dependencies.auth_service:
-        await dependencies.auth_service.stop()
-
-    logger.info("FastAPI application shut down")
@@ -2,23 +2,62 @@
 
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
+from cachetools import TTLCache
+from fastapi import APIRouter, Request
 
-from .dependencies import get_auth_service
+from .dependencies import DEFAULT_NICKNAME, get_auth_service
 from .models import AuthResponse
+from .responses import SharedResponse
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# Pre-built ForwardAuth responses keyed by (client IP, nickname). Reverse proxies
+# call /auth on every request they forward, so the same few keys repeat constantly.
+# Entries are only valid for the snapshot they were built from.
+_FA_CACHE_MAX_SIZE = 4096
+_fa_cache: dict[tuple[str, str], SharedResponse] = {}
+
+# Recently denied client IPs. Unauthorized clients tend to retry in bursts; a
+# short TTL lets them skip the full check and the warning log for each retry.
+_DENY_CACHE_MAX_SIZE = 4096
+_DENY_CACHE_TTL = 1.0
+_deny_cache: TTLCache = TTLCache(maxsize=_DENY_CACHE_MAX_SIZE, ttl=_DENY_CACHE_TTL)
+_DENY_RESPONSE = SharedResponse(
+    status_code=403, content={"detail": "Forbidden: IP address not authorized"}
+)
+
+# Snapshot version the cached decisions above were built from
+_cache_version: int | None = None
+
+
+def _sync_caches(snapshot_version: int) -> None:
+    """Drop cached decisions built from a previous authorization snapshot."""
+    global _cache_version
+
+    if snapshot_version != _cache_version:
+        _fa_cache.clear()
+        _deny_cache.clear()
+        _cache_version = snapshot_version
+
+
+def _authorized_response(client_ip: str, nickname: str) -> SharedResponse:
+    """Return the cached 200 response for a client, building it on first use."""
+    if len(_fa_cache) >= _FA_CACHE_MAX_SIZE:
+        _fa_cache.clear()
+
+    key = (client_ip, nickname)
+    response = _fa_cache.get(key)
+    if response is None:
+        response = SharedResponse(
+            content={"status": "authorized", "ip": client_ip, "user": nickname},
+            headers={"X-Auth-User": nickname},
+        )
+        _fa_cache[key] = response
+    return response
+
 
-@router.get("")
-@router.post("")
-@router.put("")
-@router.delete("")
-@router.patch("")
-@router.head("")
 async def forward_auth(request: Request):
     """
     ForwardAuth endpoint compatible with reverse proxies like Traefik.
@@ -31,111 +70,99 @@ async def forward_auth(request: Request):
         - 403 Forbidden: If the requesting IP is not authorized
         - 503 Service Unavailable: If the auth service is not available
 
-    The client IP is extracted from X-Forwarded-For header (for reverse proxies)
-    or falls back to the direct client IP.
+    The client IP is the connecting address, which the server's proxy headers
+    handling has already replaced with the original client from X-Forwarded-For
+    when the request came through a trusted proxy.
     """
-    auth_service = get_auth_service()
+    auth_service = get_auth_service(request)
+    await auth_service.refresh_if_stale()
+    client_ip = request.client.host
 
-    # Extract client IP from X-Forwarded-For header or direct connection
-    forwarded_for = request.headers.get("X-Forwarded-For")
-    if forwarded_for:
-        # X-Forwarded-For can contain multiple IPs, take the first one (original client)
-        client_ip = forwarded_for.split(",")[0].strip()
-    else:
-        # Fallback to direct client IP
-        client_ip = request.client.host
+    _sync_caches(auth_service.snapshot_version)
+    if client_ip in _deny_cache:
+        return _DENY_RESPONSE
 
-    # Check authorization
-    is_authorized = auth_service.is_authorized(client_ip)
+    is_authorized, user_info = auth_service.authorize(client_ip)
+    nickname = user_info.nickname if user_info else DEFAULT_NICKNAME
 
     if is_authorized:
-        user_info = auth_service.get_authorized_user_info(client_ip)
-
-        nickname = "localuser"
-        if user_info:
-            nickname = user_info.get("nickname")
-
-        logger.info(f"Authorized request from {client_ip} (user: {nickname})")
+        logger.info("Authorized request from %s (user: %s)", client_ip, nickname)
 
         # Return 200 OK with user information in headers and body
-        return JSONResponse(
-            status_code=200,
-            content={
-                "status": "authorized",
-                "ip": client_ip,
-                "user": nickname,
-            },
-            headers={
-                "X-Auth-User": nickname,
-            },
-        )
+        return _authorized_response(client_ip, nickname)
     else:
-        logger.warning(f"Unauthorized request from {client_ip}")
-        raise HTTPException(status_code=403, detail="Forbidden: IP address not authorized")
+        logger.warning("Unauthorized request from %s", client_ip)
+        _deny_cache[client_ip] = True
+        return _DENY_RESPONSE
+
+
+# Registered as a single route for every method a proxied request may use. Hidden
+# from the OpenAPI schema, which would otherwise get one duplicate operation per method.
+router.add_api_route(
+    "",
+    forward_auth,
+    methods=["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD"],
+    include_in_schema=False,
+)
 
 
-@router.get("/check", response_model=AuthResponse)
+@router.get("/check", responses={200: {"model": AuthResponse}})
 async def check_auth(request: Request):
     """
     Check if the requesting IP address is authorized.
 
     The IP address is automatically extracted from the request.
     """
-    auth_service = get_auth_service()
+    auth_service = get_auth_service(request)
+    await auth_service.refresh_if_stale()
 
     # Get client IP from request
     client_ip = request.client.host
 
-    is_authorized = auth_service.is_authorized(client_ip)
-    user_info = None
+    is_authorized, user_info = auth_service.authorize(client_ip)
 
-    if is_authorized:
-        user_info = auth_service.get_authorized_user_info(client_ip)
-
-    return AuthResponse(
-        authorized=is_authorized,
-        ip_address=client_ip,
-        user_info=user_info,
-    )
+    return {
+        "authorized": is_authorized,
+        "ip_address": client_ip,
+        "user_info": user_info,
+    }
 
 
-@router.get("/check/{ip_address}", response_model=AuthResponse)
-async def check_auth_by_ip(ip_address: str):
+@router.get("/check/{ip_address}", responses={200: {"model": AuthResponse}})
+async def check_auth_by_ip(request: Request, ip_address: str):
     """
     Check if a specific IP address is authorized.
 
     Args:
         ip_address: The IP address to check.
     """
-    auth_service = get_auth_service()
+    auth_service = get_auth_service(request)
+    await auth_service.refresh_if_stale()
 
-    is_authorized = auth_service.is_authorized(ip_address)
-    user_info = None
+    is_authorized, user_info = auth_service.authorize(ip_address)
 
-    if is_authorized:
-        user_info = auth_service.get_authorized_user_info(ip_address)
-
-    return AuthResponse(
-        authorized=is_authorized,
-        ip_address=ip_address,
-        user_info=user_info,
-    )
+    return {
+        "authorized": is_authorized,
+        "ip_address": ip_address,
+        "user_info": user_info,
+    }
 
 
-@router.post("/refresh", response_model=dict)
-async def refresh_auth():
+@router.post("/refresh", status_code=202)
+async def refresh_auth(request: Request):
     """
     Manually trigger a refresh of authorized users from TeamSpeak.
 
-    This endpoint forces an immediate update instead of waiting for the
-    scheduled cache refresh.
+    The refresh runs in the background instead of waiting for the cache to
+    expire; the response is returned as soon as it is scheduled.
+    Concurrent calls share a single in-flight refresh.
     """
-    auth_service = get_auth_service()
+    auth_service = get_auth_service(request)
 
-    await auth_service.update_authorized_users()
+    auth_service.schedule_update()
 
     return {
-        "status": "refreshed",
+        "status": "scheduled",
         "authorized_users_count": len(auth_service.authorized_ips),
         "cache_age_seconds": auth_service.get_cache_age(),
     }
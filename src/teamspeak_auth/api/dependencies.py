@@ -1,15 +1,16 @@
 """Shared dependencies for API endpoints."""
 
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
 
 from ..auth_service import AuthorizationService
 
-# Global authorization service instance
-auth_service: AuthorizationService | None = None
+# Nickname reported for IPs authorized without a TeamSpeak client (e.g. via subnet)
+DEFAULT_NICKNAME = "localuser"
 
 
-def get_auth_service() -> AuthorizationService:
+def get_auth_service(request: Request) -> AuthorizationService:
     """Get the authorization service, raising an error if not available."""
-    if not auth_service:
-        raise HTTPException(status_code=503, detail="Authorization service not available")
-    return auth_service
+    try:
+        return request.app.state.auth_service
+    except AttributeError:
+        raise HTTPException(status_code=503, detail="Authorization service not available") from None
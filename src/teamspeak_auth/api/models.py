@@ -50,7 +50,7 @@ class OMEAdmissionRequest(BaseModel):
 
 
 class OMEAdmissionResponse(BaseModel):
-    """Response model for OvenMediaEngine Admission Webhook."""
+    """Response model for OvenMediaEngine Admission Webhook (documentation only)."""
 
     allowed: bool | None = None
     new_url: str | None = None
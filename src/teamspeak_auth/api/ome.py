@@ -2,18 +2,50 @@
 
 import logging
 
-from fastapi import APIRouter
+import orjson
+from fastapi import APIRouter, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
 
-from .dependencies import get_auth_service
+from .dependencies import DEFAULT_NICKNAME, get_auth_service
 from .models import OMEAdmissionRequest, OMEAdmissionResponse
+from .responses import SharedResponse
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ome", tags=["ome"])
 
 
-@router.post("/admission")
-async def ome_admission_webhook(payload: OMEAdmissionRequest):
+def _inline_schema(model: type[BaseModel]) -> dict:
+    """Build a model's JSON schema with nested model references inlined."""
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+    for prop in schema["properties"].values():
+        ref = prop.pop("$ref", None)
+        if ref:
+            prop.update(defs[ref.rsplit("/", 1)[-1]])
+    return schema
+
+
+# Admission decisions never vary per request, so they are rendered once
+_ALLOW_RESPONSE = SharedResponse({"allowed": True, "lifetime": 0})  # lifetime 0 = no timeout
+_DENY_RESPONSE = SharedResponse({"allowed": False, "reason": "IP address not authorized"})
+
+# The body is parsed by hand (see below), so document it explicitly
+_ADMISSION_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _inline_schema(OMEAdmissionRequest)}},
+    }
+}
+
+
+@router.post(
+    "/admission",
+    responses={200: {"model": OMEAdmissionResponse}},
+    openapi_extra=_ADMISSION_REQUEST_BODY,
+)
+async def ome_admission_webhook(request: Request):
     """
     OvenMediaEngine Admission Webhook endpoint.
 
@@ -27,42 +59,64 @@ async def ome_admission_webhook(payload: OMEAdmissionRequest):
         - For opening: {"allowed": true/false, "reason": "..."}
         - For closing: {}
     """
-    auth_service = get_auth_service()
-
-    # For closing status, return empty object
-    if payload.request.status == "closing":
-        logger.debug(
-            f"OME closing: {payload.client.address} - {payload.request.direction} "
-            f"{payload.request.protocol} {payload.request.url}"
-        )
+    auth_service = get_auth_service(request)
+
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError as e:
+        raise RequestValidationError(
+            [{"type": "json_invalid", "loc": ("body",), "msg": "JSON decode error", "input": {}}]
+        ) from e
+
+    # For closing status, return empty object. Nothing in the payload is used,
+    # so skip validating it: closings arrive as often as openings.
+    request_info = body.get("request") if isinstance(body, dict) else None
+    if isinstance(request_info, dict) and request_info.get("status") == "closing":
+        if logger.isEnabledFor(logging.DEBUG):
+            client_info = body.get("client")
+            logger.debug(
+                "OME closing: %s - %s %s %s",
+                client_info.get("address") if isinstance(client_info, dict) else None,
+                request_info.get("direction"),
+                request_info.get("protocol"),
+                request_info.get("url"),
+            )
         return {}
 
+    try:
+        payload = OMEAdmissionRequest.model_validate(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)],
+            body=body,
+        ) from None
+
     # For opening status, check authorization
     # Use real_ip if available (forwarded), otherwise use address
     client_ip = payload.client.real_ip or payload.client.address
 
-    is_authorized = auth_service.is_authorized(client_ip)
+    await auth_service.refresh_if_stale()
+    is_authorized, user_info = auth_service.authorize(client_ip)
+    nickname = user_info.nickname if user_info else DEFAULT_NICKNAME
 
     if is_authorized:
-        user_info = auth_service.get_authorized_user_info(client_ip)
-        nickname = user_info.get("nickname") if user_info else "localuser"
-
         logger.info(
-            f"OME authorized: {client_ip} (user: {nickname}) - {payload.request.direction} "
-            f"{payload.request.protocol} {payload.request.url}"
+            "OME authorized: %s (user: %s) - %s %s %s",
+            client_ip,
+            nickname,
+            payload.request.direction,
+            payload.request.protocol,
+            payload.request.url,
         )
 
-        return OMEAdmissionResponse(
-            allowed=True,
-            lifetime=0,  # No timeout
-        )
+        return _ALLOW_RESPONSE
     else:
         logger.warning(
-            f"OME rejected: {client_ip} - {payload.request.direction} "
-            f"{payload.request.protocol} {payload.request.url}"
+            "OME rejected: %s - %s %s %s",
+            client_ip,
+            payload.request.direction,
+            payload.request.protocol,
+            payload.request.url,
         )
 
-        return OMEAdmissionResponse(
-            allowed=False,
-            reason="IP address not authorized",
-        )
+        return _DENY_RESPONSE
@@ -0,0 +1,22 @@
+"""Response classes for the API."""
+
+from fastapi.responses import ORJSONResponse
+from starlette.types import Message, Receive, Scope, Send
+
+
+class SharedResponse(ORJSONResponse):
+    """
+    JSON response that is rendered once and returned for many requests.
+
+    Starlette sends a response's own header list to the server, and middleware
+    such as GZipMiddleware edits the list it receives in place. Each send gets a
+    copy instead, so headers added for one request never leak into the next.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async def send_with_own_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message["headers"])}
+            await send(message)
+
+        await super().__call__(scope, receive, send_with_own_headers)
@@ -2,13 +2,13 @@
 
 from fastapi import APIRouter
 
-router = APIRouter(tags=["root"])
+from .responses import SharedResponse
 
+router = APIRouter(tags=["root"])
 
-@router.get("/", response_model=dict)
-async def root():
-    """Root endpoint with API information."""
-    return {
+# The payload never changes, so it is rendered once at import time
+_ROOT_RESPONSE = SharedResponse(
+    {
         "service": "TeamSpeak Auth API",
         "version": "0.1.0",
         "endpoints": {
@@ -19,3 +19,10 @@ async def root():
             "/status": "Service status and statistics",
         },
     }
+)
+
+
+@router.get("/")
+async def root():
+    """Root endpoint with API information."""
+    return _ROOT_RESPONSE
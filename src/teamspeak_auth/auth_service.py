@@ -1,160 +1,307 @@
 """Authorization service for managing user authorization state."""
 
 import asyncio
-import ipaddress
 import logging
 import time
+from dataclasses import dataclass
 
+from .addresses import SubnetTable, ip_to_int
 from .config import config
-from .ts_client import TeamSpeakClient
+from .ts_client import AuthorizedClient, TeamSpeakClient
 
 logger = logging.getLogger(__name__)
 
+# Seconds a request waits for an update of an expired cache. A dead connection
+# can otherwise take several ServerQuery timeouts to fail over.
+_MAX_UPDATE_WAIT = 10.0
+
+
+@dataclass(slots=True, frozen=True)
+class AuthSnapshot:
+    """
+    Authorized TeamSpeak clients and every lookup structure derived from them.
+
+    A snapshot is fully built before it is published and is never modified
+    afterwards, so readers holding a reference always see consistent data.
+    """
+
+    version: int
+    # Client information keyed by ip_to_int()
+    clients: dict[int, AuthorizedClient]
+    ips: frozenset[str]
+    ip_tuple: tuple[str, ...]
+    # Authorized subnets plus every client address
+    table: SubnetTable
+
+    @classmethod
+    def build(
+        cls, version: int, clients: dict[str, AuthorizedClient], subnets: SubnetTable
+    ) -> "AuthSnapshot":
+        """
+        Build a snapshot from TeamSpeak clients.
+
+        Clients with an invalid IP address are logged and skipped.
+
+        Args:
+            version: The snapshot version.
+            clients: Dictionary mapping IP addresses to client information.
+            subnets: The authorized subnets.
+
+        Returns:
+            The new snapshot.
+        """
+        clients_by_key = {}
+        valid_ips = []
+        for ip_address, client_info in clients.items():
+            ip_key = ip_to_int(ip_address)
+            if ip_key is None:
+                logger.warning("Ignoring client with invalid IP address '%s'", ip_address)
+                continue
+            clients_by_key[ip_key] = client_info
+            valid_ips.append(ip_address)
+
+        ips = frozenset(valid_ips)
+        return cls(
+            version=version,
+            clients=clients_by_key,
+            ips=ips,
+            ip_tuple=tuple(ips),
+            table=subnets.with_hosts(clients_by_key),
+        )
+
 
 class AuthorizationService:
     """Service for managing authorization state and checking user authorization."""
 
     def __init__(self):
         """Initialize the authorization service."""
-        self.authorized_ips: dict[str, dict] = {}
-        self.last_update: float = 0
+        self._authorized_subnets = SubnetTable(config.authorized_subnets)
+        # Replaced as a whole on every update, never modified in place
+        self.snapshot = AuthSnapshot.build(0, {}, self._authorized_subnets)
+        # time.monotonic_ns() of the last successful update, so wall-clock steps
+        # cannot make the cache look fresher or staler than it is
+        self._last_update_ns: int = 0
+        self._next_refresh_ns: int = 0
+        self._cache_ttl_ns: int = config.cache_ttl * 1_000_000_000
+        # Past this age requests wait for an update instead of using the cache
+        self._max_age_ns: int = 2 * self._cache_ttl_ns
         self.ts_client = TeamSpeakClient()
-        self._update_lock = asyncio.Lock()
-        self._background_task: asyncio.Task | None = None
+        self._refresh_task: asyncio.Task | None = None
+        # The update currently talking to TeamSpeak, shared by all callers
+        self._inflight_update: asyncio.Task | None = None
+
+    @property
+    def authorized_ips(self) -> frozenset[str]:
+        """IP addresses of the currently authorized TeamSpeak clients."""
+        return self.snapshot.ips
+
+    @property
+    def last_update(self) -> float:
+        """time.monotonic() of the last successful update, 0 if there was none."""
+        return self._last_update_ns / 1e9
+
+    @last_update.setter
+    def last_update(self, value: float) -> None:
+        self._last_update_ns = int(value * 1e9)
+
+    @property
+    def snapshot_version(self) -> int:
+        """Version of the current snapshot, bumped on every update."""
+        return self.snapshot.version
 
     async def start(self) -> None:
-        """Start the authorization service and background update task."""
+        """Start the authorization service and load the initial authorized users."""
         logger.info("Starting authorization service")
 
         # Initial update
         await self.update_authorized_users()
 
-        # Start background task for periodic updates
-        self._background_task = asyncio.create_task(self._periodic_update())
         logger.info("Authorization service started")
 
     async def stop(self) -> None:
         """Stop the authorization service."""
         logger.info("Stopping authorization service")
 
-        if self._background_task:
-            self._background_task.cancel()
-            try:
-                await self._background_task
-            except asyncio.CancelledError:
-                pass
+        for task in (self._refresh_task, self._inflight_update):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
 
-        self.ts_client.disconnect()
+        await self.ts_client.disconnect()
         logger.info("Authorization service stopped")
 
-    async def _periodic_update(self) -> None:
-        """Periodically update the list of authorized users."""
-        while True:
+    async def refresh_if_stale(self) -> None:
+        """
+        Refresh the cached users if they are older than the cache TTL.
+
+        Called on every authorization request, so TeamSpeak is only queried
+        while the service is in use. Once the cache is older than the TTL the
+        update runs in the background and the request is answered from the
+        cache, but only for up to twice the TTL. Past that, TeamSpeak clients
+        are only authorized after a successful update: the request waits up
+        to _MAX_UPDATE_WAIT seconds for one, and if there is none the clients
+        are dropped, leaving only the authorized subnets.
+
+        At most one update is started per cache TTL, also while TeamSpeak is
+        unreachable; a cache TTL of 0 updates on every request (coalesced
+        with any in flight).
+        """
+        now = time.monotonic_ns()
+        last_update_ns = self._last_update_ns
+        expired = now - last_update_ns >= self._max_age_ns
+        start_update = now >= self._next_refresh_ns
+        if start_update:
+            self._next_refresh_ns = now + self._cache_ttl_ns
+        if not expired:
+            if start_update:
+                self.schedule_update()
+            return
+
+        update_running = self._inflight_update is not None and not self._inflight_update.done()
+        if start_update or update_running:
             try:
-                await asyncio.sleep(config.cache_ttl)
-                await self.update_authorized_users()
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"Error in periodic update: {e}")
+                async with asyncio.timeout(_MAX_UPDATE_WAIT):
+                    await self.update_authorized_users()
+            except TimeoutError:
+                # The update itself is shielded and keeps running
+                logger.warning("Timed out waiting for the authorized users to be updated")
+
+        # Also reached when the update for this TTL has already failed
+        if self._last_update_ns == last_update_ns and self.snapshot.clients:
+            logger.warning(
+                "Authorized users are older than %.0fs and could not be refreshed, "
+                "dropping TeamSpeak clients until the next successful update",
+                self._max_age_ns / 1e9,
+            )
+            self.set_authorized_clients({})
+
+    def schedule_update(self) -> None:
+        """
+        Schedule an update of the authorized users in the background.
+
+        Does nothing if a scheduled update is still running, so bursts of
+        requests share a single TeamSpeak round-trip.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.update_authorized_users())
 
     async def update_authorized_users(self) -> None:
-        """Update the cached list of authorized users from TeamSpeak."""
-        async with self._update_lock:
-            try:
-                # Run TeamSpeak operations in thread pool to avoid blocking
-                loop = asyncio.get_event_loop()
-                authorized_clients = await loop.run_in_executor(
-                    None, self._fetch_authorized_clients
-                )
+        """
+        Update the cached list of authorized users from TeamSpeak.
+
+        Callers arriving while an update is in flight wait for that update
+        instead of starting another one after it.
+        """
+        if self._inflight_update is None or self._inflight_update.done():
+            self._inflight_update = asyncio.create_task(self._update_authorized_users())
+        # Shielded so a cancelled caller does not cancel the update for the others
+        await asyncio.shield(self._inflight_update)
 
-                self.authorized_ips = authorized_clients
-                self.last_update = time.time()
+    async def _update_authorized_users(self) -> None:
+        """Fetch the authorized users from TeamSpeak and publish them."""
+        try:
+            authorized_clients = await self._fetch_authorized_clients()
 
-                logger.info(
-                    f"Updated authorized users: {len(self.authorized_ips)} IP(s) authorized"
-                )
-                logger.debug(f"Authorized IPs: {list(self.authorized_ips.keys())}")
-            except Exception as e:
-                logger.error(f"Failed to update authorized users: {e}")
+            self.set_authorized_clients(authorized_clients)
+            self._last_update_ns = time.monotonic_ns()
+            self._next_refresh_ns = self._last_update_ns + self._cache_ttl_ns
 
-    def _fetch_authorized_clients(self) -> dict[str, dict]:
+            logger.info(f"Updated authorized users: {len(self.authorized_ips)} IP(s) authorized")
+            logger.debug("Authorized IPs: %s", self.snapshot.ip_tuple)
+        except Exception as e:
+            logger.error(f"Failed to update authorized users: {e}")
+
+    def set_authorized_clients(self, clients: dict[str, AuthorizedClient]) -> None:
         """
-        Fetch authorized clients from TeamSpeak (blocking operation).
+        Publish a new set of authorized TeamSpeak clients.
+
+        The snapshot and everything derived from it are built first and then
+        published with a single assignment. Its version is bumped so caches
+        derived from the previous snapshot can be invalidated.
+
+        Args:
+            clients: Dictionary mapping IP addresses to client information.
+        """
+        self.snapshot = AuthSnapshot.build(
+            self.snapshot.version + 1, clients, self._authorized_subnets
+        )
+
+    async def _fetch_authorized_clients(self) -> dict[str, AuthorizedClient]:
+        """
+        Fetch authorized clients from TeamSpeak.
+
+        The ServerQuery connection is kept open between refreshes. The server
+        drops idle query connections, so if the existing connection turns out
+        to be gone, it is reopened once and the query retried.
 
         Returns:
             Dictionary mapping IP addresses to client information.
         """
         try:
-            # Connect if not already connected
-            if not self.ts_client.connection:
-                self.ts_client.connect()
+            if self.ts_client.connection:
+                try:
+                    return await self.ts_client.get_authorized_clients()
+                except OSError as e:
+                    logger.info("TeamSpeak connection lost (%s), reconnecting", e)
+                    await self.ts_client.disconnect()
 
-            return self.ts_client.get_authorized_clients()
+            await self.ts_client.connect()
+            return await self.ts_client.get_authorized_clients()
         except Exception as e:
             logger.error(f"Error fetching authorized clients: {e}")
             # Try to reconnect on next attempt
-            self.ts_client.disconnect()
+            await self.ts_client.disconnect()
             raise
 
-    def _is_in_authorized_subnet(self, ip_address: str) -> bool:
+    def authorize(self, ip_address: str) -> tuple[bool, AuthorizedClient | None]:
         """
-        Check if an IP address is in any of the authorized subnets.
+        Check if an IP address is authorized and look up its TeamSpeak client.
+
+        An IP is authorized if it is in an authorized subnet or belongs to an
+        authorized TeamSpeak client. Both are answered by a single lookup in
+        a table holding the subnets and every client address; the client is
+        only looked up for authorized addresses.
 
         Args:
             ip_address: The IP address to check.
 
         Returns:
-            True if the IP is in an authorized subnet, False otherwise.
+            Whether the IP address is authorized, and the TeamSpeak client
+            using it (None if there is none, e.g. authorized via subnet).
         """
-        if not config.authorized_subnets:
-            return False
-
-        try:
-            ip = ipaddress.ip_address(ip_address)
-            for subnet_str in config.authorized_subnets:
-                try:
-                    subnet = ipaddress.ip_network(subnet_str, strict=False)
-                    if ip in subnet:
-                        logger.debug(f"IP {ip_address} is in authorized subnet {subnet_str}")
-                        return True
-                except ValueError as e:
-                    logger.warning(f"Invalid subnet configuration '{subnet_str}': {e}")
-            return False
-        except ValueError as e:
-            logger.warning(f"Invalid IP address '{ip_address}': {e}")
-            return False
+        ip_key = ip_to_int(ip_address)
+        if ip_key is None:
+            logger.warning("Invalid IP address '%s'", ip_address)
+            return False, None
+
+        snapshot = self.snapshot
+        if ip_key not in snapshot.table:
+            logger.debug("IP %s is not authorized", ip_address)
+            return False, None
+
+        client_info = snapshot.clients.get(ip_key)
+        if client_info is not None:
+            logger.debug("IP %s is authorized (user: %s)", ip_address, client_info.nickname)
+        else:
+            logger.debug("IP %s is authorized via subnet", ip_address)
+        return True, client_info
 
     def is_authorized(self, ip_address: str) -> bool:
         """
         Check if an IP address is authorized.
 
-        First checks if the IP is in an authorized subnet, then checks
-        if the IP is in the list of authorized TeamSpeak clients.
-
         Args:
             ip_address: The IP address to check.
 
         Returns:
             True if the IP address is authorized, False otherwise.
         """
-        # First check if IP is in an authorized subnet
-        if self._is_in_authorized_subnet(ip_address):
-            logger.debug(f"IP {ip_address} is authorized via subnet")
-            return True
-
-        # Then check if IP is in the TeamSpeak authorized list
-        is_auth = ip_address in self.authorized_ips
-
-        if is_auth:
-            client_info = self.authorized_ips[ip_address]
-            logger.debug(f"IP {ip_address} is authorized (user: {client_info.get('nickname')})")
-        else:
-            logger.debug(f"IP {ip_address} is not authorized")
-
-        return is_auth
+        return self.authorize(ip_address)[0]
 
-    def get_authorized_user_info(self, ip_address: str) -> dict | None:
+    def get_authorized_user_info(self, ip_address: str) -> AuthorizedClient | None:
         """
         Get information about an authorized user.
 
@@ -162,18 +309,20 @@ class AuthorizationService:
             ip_address: The IP address to look up.
 
         Returns:
-            User information dictionary if authorized, None otherwise.
+            The authorized client, None otherwise.
         """
-        return self.authorized_ips.get(ip_address)
+        return self.snapshot.clients.get(ip_to_int(ip_address))
 
-    def get_all_authorized_ips(self) -> list[str]:
+    def get_all_authorized_ips(self) -> tuple[str, ...]:
         """
-        Get list of all currently authorized IP addresses.
+        Get all currently authorized IP addresses.
+
+        The tuple is built once per refresh and shared between callers.
 
         Returns:
-            List of authorized IP addresses.
+            Tuple of authorized IP addresses.
         """
-        return list(self.authorized_ips.keys())
+        return self.snapshot.ip_tuple
 
     def get_cache_age(self) -> float:
         """
@@ -182,4 +331,4 @@ class AuthorizationService:
         Returns:
             Seconds since last update.
         """
-        return time.time() - self.last_update
+        return (time.monotonic_ns() - self._last_update_ns) / 1e9
@@ -12,6 +12,8 @@ class Config(BaseSettings):
         env_file_encoding="utf-8",
         case_sensitive=False,
         extra="ignore",
+        # Derived lookup structures are built once from these values at startup
+        frozen=True,
     )
 
     # TeamSpeak ServerQuery connection settings
@@ -52,11 +54,30 @@ class Config(BaseSettings):
         default=8000,
         description="API server port",
     )
+    api_workers: int = Field(
+        default=1,
+        ge=1,
+        description="Number of API worker processes",
+    )
+    trusted_proxy_ips: str = Field(
+        default="*",
+        description="Comma-separated list of proxy IPs/networks whose X-Forwarded-For header is trusted",
+    )
+    api_thread_limit: int = Field(
+        default=200,
+        ge=1,
+        description="Maximum number of threads for running synchronous work per worker",
+    )
 
     # Cache settings
     cache_ttl: int = Field(
         default=30,
-        description="How long to cache TeamSpeak user data in seconds",
+        description="How long to cache TeamSpeak user data in seconds (0 refreshes on every request)",
+    )
+    ip_cache_size: int = Field(
+        default=4096,
+        ge=0,
+        description="Number of parsed client IP addresses to keep cached per worker",
     )
 
     # Authorization settings
@@ -73,6 +94,16 @@ class Config(BaseSettings):
             return v
         return [int(x.strip()) for x in v.split(",")]
 
+    @property
+    def required_server_group_ids(self) -> frozenset[str]:
+        """
+        Required server group IDs as strings, the form ServerQuery reports them in.
+
+        Computed on access rather than cached, so copies made with model_copy()
+        see their own groups. TeamSpeakClient keeps the set it was built with.
+        """
+        return frozenset(str(group) for group in self.required_server_groups)
+
     @field_validator("authorized_subnets", mode="after")
     @classmethod
     def parse_authorized_subnets(cls, v: str) -> list[str]:
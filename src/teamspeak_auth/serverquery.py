@@ -0,0 +1,271 @@
+"""Minimal asyncio client for the TeamSpeak 3 ServerQuery protocol."""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ServerQuery terminates every line with "\n\r"
+_LINE_SEPARATOR = b"\n\r"
+# A whole response arrives on one line, so allow for large client lists
+_STREAM_LIMIT = 4 * 1024 * 1024
+
+_ESCAPES = (
+    ("\\", r"\\"),
+    ("/", r"\/"),
+    (" ", r"\s"),
+    ("|", r"\p"),
+    ("\a", r"\a"),
+    ("\b", r"\b"),
+    ("\f", r"\f"),
+    ("\n", r"\n"),
+    ("\r", r"\r"),
+    ("\t", r"\t"),
+    ("\v", r"\v"),
+)
+_UNESCAPES = {escaped[1]: char for char, escaped in _ESCAPES}
+
+
+class ServerQueryError(Exception):
+    """Raised when the server answers a command with a non-zero error id."""
+
+    def __init__(self, error_id: int, message: str):
+        """
+        Initialize the error.
+
+        Args:
+            error_id: The ServerQuery error id.
+            message: The error message sent by the server.
+        """
+        super().__init__(f"error id {error_id}: {message}")
+        self.error_id = error_id
+        self.message = message
+
+
+def escape(value: str) -> str:
+    """
+    Escape a value for use as a ServerQuery command parameter.
+
+    Args:
+        value: The raw value.
+
+    Returns:
+        The escaped value.
+    """
+    for char, escaped in _ESCAPES:
+        value = value.replace(char, escaped)
+    return value
+
+
+def unescape(value: str) -> str:
+    """
+    Reverse ServerQuery escaping of a response value.
+
+    Args:
+        value: The escaped value.
+
+    Returns:
+        The raw value.
+    """
+    if "\\" not in value:
+        return value
+
+    chars = []
+    i = 0
+    while i < len(value):
+        if value[i] == "\\" and i + 1 < len(value):
+            chars.append(_UNESCAPES.get(value[i + 1], value[i + 1]))
+            i += 2
+        else:
+            chars.append(value[i])
+            i += 1
+    return "".join(chars)
+
+
+def parse_properties(line: str) -> dict[str, str]:
+    """
+    Parse one space-separated record of key=value properties.
+
+    Args:
+        line: A single record, e.g. "clid=1 client_nickname=Foo\\sBar".
+
+    Returns:
+        Dictionary of unescaped property values. Bare flags map to "".
+    """
+    properties = {}
+    for item in line.split(" "):
+        if not item:
+            continue
+        key, _, value = item.partition("=")
+        properties[key] = unescape(value)
+    return properties
+
+
+def parse_response(data: str) -> list[dict[str, str]]:
+    """
+    Parse the data lines of a command response.
+
+    Args:
+        data: The response data, records separated by "|".
+
+    Returns:
+        List of records.
+    """
+    if not data:
+        return []
+    return [parse_properties(record) for record in data.split("|")]
+
+
+def build_command(command: str, *options: str, **params: object) -> str:
+    """
+    Build a ServerQuery command line.
+
+    Args:
+        command: The command name, e.g. "clientlist".
+        *options: Option flags without the leading dash, e.g. "ip".
+        **params: Command parameters, escaped automatically.
+
+    Returns:
+        The command line without the trailing newline.
+    """
+    parts = [command]
+    parts.extend(f"{key}={escape(str(value))}" for key, value in params.items())
+    parts.extend(f"-{option}" for option in options)
+    return " ".join(parts)
+
+
+class ServerQueryConnection:
+    """A single ServerQuery connection driven by the asyncio event loop."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timeout: float):
+        """
+        Initialize the connection. Use ServerQueryConnection.open() instead.
+
+        Args:
+            reader: Stream reader of the connected socket.
+            writer: Stream writer of the connected socket.
+            timeout: Seconds to wait for a command to complete.
+        """
+        self._reader = reader
+        self._writer = writer
+        self._timeout = timeout
+        self._lock = asyncio.Lock()
+        # Set once the connection may hold responses nobody has read
+        self._closed = False
+
+    @classmethod
+    async def open(cls, host: str, port: int, timeout: float = 10.0) -> "ServerQueryConnection":
+        """
+        Connect to a ServerQuery interface and consume its greeting.
+
+        Args:
+            host: The server hostname.
+            port: The ServerQuery port.
+            timeout: Seconds to wait for the connection and for each command.
+
+        Returns:
+            The open connection.
+        """
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_connection(host, port, limit=_STREAM_LIMIT)
+            connection = cls(reader, writer, timeout)
+            try:
+                banner = await connection._read_line()
+                if banner != "TS3":
+                    raise ConnectionError(f"Unexpected ServerQuery greeting: {banner!r}")
+                # Welcome message
+                await connection._read_line()
+            except BaseException:
+                writer.close()
+                raise
+        return connection
+
+    async def query(self, command: str, *options: str, **params: object) -> list[dict[str, str]]:
+        """
+        Send a command and wait for its response.
+
+        Args:
+            command: The command name, e.g. "clientlist".
+            *options: Option flags without the leading dash, e.g. "ip".
+            **params: Command parameters, escaped automatically.
+
+        Returns:
+            List of records returned by the server.
+
+        Raises:
+            ServerQueryError: If the server reports an error.
+        """
+        (records,) = await self.pipeline(build_command(command, *options, **params))
+        return records
+
+    async def pipeline(self, *commands: str) -> list[list[dict[str, str]]]:
+        """
+        Send several commands at once and read their responses in order.
+
+        The commands share a single round-trip instead of one each. All
+        responses are read even if one fails, so the connection stays in sync.
+        If reading is interrupted by the timeout, cancellation or a broken
+        stream, the connection is closed instead, as replies still in the
+        stream would otherwise be taken for those of the next command.
+
+        Args:
+            *commands: Command lines as returned by build_command().
+
+        Returns:
+            The records returned for each command.
+
+        Raises:
+            ServerQueryError: For the first command the server reports an error for.
+            ConnectionError: If the connection has been closed.
+        """
+        async with self._lock:
+            if self._closed:
+                raise ConnectionError("ServerQuery connection is closed")
+            try:
+                async with asyncio.timeout(self._timeout):
+                    self._writer.write(b"".join(command.encode() + b"\n" for command in commands))
+                    await self._writer.drain()
+
+                    responses = [await self._read_response() for _ in commands]
+            except BaseException:
+                self._closed = True
+                self._writer.close()
+                raise
+
+        results = []
+        for error, data in responses:
+            error_id = int(error.get("id", "0"))
+            if error_id != 0:
+                raise ServerQueryError(error_id, error.get("msg", ""))
+            results.append(parse_response(data))
+        return results
+
+    async def close(self) -> None:
+        """Send quit and close the socket."""
+        self._closed = True
+        try:
+            self._writer.write(b"quit\n")
+            self._writer.close()
+            await self._writer.wait_closed()
+        except (OSError, RuntimeError) as e:
+            logger.debug("Error while closing ServerQuery connection: %s", e)
+
+    async def _read_response(self) -> tuple[dict[str, str], str]:
+        """Read one command response, returning its error properties and data line."""
+        data = ""
+        while True:
+            line = await self._read_line()
+            if line.startswith("error "):
+                return parse_properties(line[len("error ") :]), data
+            if not line.startswith("notify"):
+                data = line
+
+    async def _read_line(self) -> str:
+        """Read one line, without the separator."""
+        try:
+            line = await self._reader.readuntil(_LINE_SEPARATOR)
+        except asyncio.IncompleteReadError as e:
+            raise ConnectionError("ServerQuery connection closed by server") from e
+        except asyncio.LimitOverrunError as e:
+            raise ConnectionError("ServerQuery response exceeds the read limit") from e
+        return line[: -len(_LINE_SEPARATOR)].decode("utf-8", errors="replace")
@@ -1,50 +1,73 @@
 """TeamSpeak client for connecting and retrieving user data."""
 
 import logging
-
-import ts3
+from dataclasses import dataclass
 
 from .config import config
+from .serverquery import ServerQueryConnection, build_command
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(slots=True, frozen=True)
+class AuthorizedClient:
+    """A connected TeamSpeak client holding one of the required server groups."""
+
+    nickname: str
+    groups: tuple[str, ...]
+    client_id: str
+    client_db_id: str
+
+
 class TeamSpeakClient:
     """Client for interacting with TeamSpeak ServerQuery."""
 
     def __init__(self):
         """Initialize the TeamSpeak client."""
-        self.connection: ts3.query.TS3Connection | None = None
+        self.connection: ServerQueryConnection | None = None
+        self._required_groups = config.required_server_group_ids
 
-    def connect(self) -> None:
+    async def connect(self) -> None:
         """Connect to the TeamSpeak ServerQuery interface."""
         try:
-            self.connection = ts3.query.TS3Connection(config.ts_host, config.ts_port)
-            self.connection.login(
-                client_login_name=config.ts_user,
-                client_login_password=config.ts_password,
-            )
-            self.connection.use(sid=config.ts_server_id)
+            connection = await ServerQueryConnection.open(config.ts_host, config.ts_port)
+            try:
+                # Log in and select the virtual server in a single round-trip
+                await connection.pipeline(
+                    build_command(
+                        "login",
+                        client_login_name=config.ts_user,
+                        client_login_password=config.ts_password,
+                    ),
+                    build_command("use", sid=config.ts_server_id),
+                )
+            except BaseException:
+                await connection.close()
+                raise
+            self.connection = connection
             logger.info(f"Connected to TeamSpeak server at {config.ts_host}:{config.ts_port}")
         except Exception as e:
             logger.error(f"Failed to connect to TeamSpeak server: {e}")
             raise
 
-    def disconnect(self) -> None:
+    async def disconnect(self) -> None:
         """Disconnect from the TeamSpeak server."""
         if self.connection:
             try:
-                self.connection.quit()
+                await self.connection.close()
                 logger.info("Disconnected from TeamSpeak server")
             except Exception as e:
                 logger.warning(f"Error during disconnect: {e}")
             finally:
                 self.connection = None
 
-    def get_connected_clients(self) -> list[dict]:
+    async def get_connected_clients(self) -> list[dict]:
         """
         Get all connected clients with their details including IP addresses.
 
+        Each client also carries its server group IDs as a comma-separated
+        string in "client_servergroups".
+
         Returns:
             List of client dictionaries containing client information.
         """
@@ -52,9 +75,10 @@ class TeamSpeakClient:
             raise RuntimeError("Not connected to TeamSpeak server")
 
         try:
-            # Get all clients with IP addresses (excluding query clients)
-            # The -ip option tells TeamSpeak to include connection_client_ip in the response
-            clients = self.connection.clientlist(ip=True)
+            # Get all clients with IP addresses and server groups (excluding query clients)
+            # The -ip option tells TeamSpeak to include connection_client_ip in the response,
+            # -groups includes client_servergroups so no per-client group lookup is needed
+            clients = await self.connection.query("clientlist", "ip", "groups")
             non_server_query_clients = [
                 client
                 for client in clients
@@ -68,41 +92,20 @@ class TeamSpeakClient:
             logger.error(f"Failed to retrieve client list: {e}")
             raise
 
-    def get_client_server_groups(self, client_db_id: str) -> list[str]:
-        """
-        Get server groups for a specific client.
-
-        Args:
-            client_db_id: The database ID of the client.
-
-        Returns:
-            List of server group IDs the client belongs to.
-        """
-        if not self.connection:
-            raise RuntimeError("Not connected to TeamSpeak server")
-
-        try:
-            groups = self.connection.servergroupsbyclientid(cldbid=client_db_id)
-            return [group["sgid"] for group in groups]
-        except Exception as e:
-            logger.error(f"Failed to retrieve server groups for client {client_db_id}: {e}")
-            return []
-
-    def get_authorized_clients(self) -> dict[str, dict]:
+    async def get_authorized_clients(self) -> dict[str, AuthorizedClient]:
         """
         Get all connected clients that have the required permissions.
 
         Returns:
             Dictionary mapping IP addresses to client information.
-            Format: {ip_address: {nickname: str, groups: list[str]}}
         """
         authorized_clients = {}
 
         try:
-            clients = self.get_connected_clients()
+            clients = await self.get_connected_clients()
 
             for client in clients:
-                logger.debug(f"Processing client: {client}")
+                logger.debug("Processing client: %s", client)
                 client_db_id = client.get("client_database_id")
                 client_ip = client.get("connection_client_ip")
                 nickname = client.get("client_nickname")
@@ -118,20 +121,21 @@ class TeamSpeakClient:
                     )
                     continue
 
-                # Get client's server groups
-                groups = self.get_client_server_groups(client_db_id)
+                # Server groups come with the client list, no extra query needed
+                client_servergroups = client.get("client_servergroups")
+                groups = tuple(client_servergroups.split(",")) if client_servergroups else ()
 
-                logger.debug(f"Client {nickname} ({client_ip}) groups: {groups}")
+                logger.debug("Client %s (%s) groups: %s", nickname, client_ip, groups)
 
                 # Check if client has any of the required groups
-                if any(str(group) in map(str, config.required_server_groups) for group in groups):
-                    authorized_clients[client_ip] = {
-                        "nickname": nickname,
-                        "groups": groups,
-                        "client_id": client.get("clid"),
-                        "client_db_id": client_db_id,
-                    }
-                    logger.debug(f"Authorized client: {nickname} ({client_ip})")
+                if not self._required_groups.isdisjoint(groups):
+                    authorized_clients[client_ip] = AuthorizedClient(
+                        nickname=nickname,
+                        groups=groups,
+                        client_id=client.get("clid"),
+                        client_db_id=client_db_id,
+                    )
+                    logger.debug("Authorized client: %s (%s)", nickname, client_ip)
 
             logger.info(f"Found {len(authorized_clients)} authorized clients")
             return authorized_clients
@@ -140,11 +144,11 @@ class TeamSpeakClient:
             logger.error(f"Failed to retrieve authorized clients: {e}")
             raise
 
-    def __enter__(self):
-        """Context manager entry."""
-        self.connect()
+    async def __aenter__(self):
+        """Async context manager entry."""
+        await self.connect()
         return self
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager exit."""
-        self.disconnect()
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit."""
+        await self.disconnect()
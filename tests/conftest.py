@@ -0,0 +1,28 @@
+"""Shared test fixtures."""
+
+import pytest
+
+# Environment variables read by Config
+CONFIG_ENV_VARS = (
+    "TS_HOST",
+    "TS_PORT",
+    "TS_USER",
+    "TS_PASSWORD",
+    "TS_SERVER_ID",
+    "REQUIRED_SERVER_GROUPS",
+    "API_HOST",
+    "API_PORT",
+    "API_WORKERS",
+    "TRUSTED_PROXY_IPS",
+    "API_THREAD_LIMIT",
+    "CACHE_TTL",
+    "IP_CACHE_SIZE",
+    "AUTHORIZED_SUBNETS",
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_config_env(monkeypatch):
+    """Remove configuration environment variables so settings come from the test only."""
+    for var in CONFIG_ENV_VARS:
+        monkeypatch.delenv(var, raising=False)
@@ -0,0 +1,78 @@
+"""Tests for IP address parsing and subnet matching."""
+
+from teamspeak_auth.addresses import SubnetTable, ip_to_int
+
+
+def test_ip_to_int():
+    """Test that IP addresses are converted to canonical integer keys."""
+    assert ip_to_int("192.168.1.100") == ip_to_int("::ffff:192.168.1.100")
+    assert ip_to_int("2001:db8::1") == ip_to_int("2001:0db8:0:0:0:0:0:1")
+    assert ip_to_int("192.168.1.100") != ip_to_int("192.168.1.101")
+    assert ip_to_int("not-an-ip") is None
+    assert ip_to_int("192.168.01.100") is None
+
+
+def test_subnet_table_matches_ipv4_and_ipv6():
+    """Test that addresses match the networks they belong to."""
+    table = SubnetTable(["192.168.1.0/24", "10.0.0.0/8", "2001:db8::/32"])
+
+    assert ip_to_int("192.168.1.50") in table
+    assert ip_to_int("10.20.30.40") in table
+    assert ip_to_int("::ffff:10.0.0.1") in table
+    assert ip_to_int("2001:db8::1") in table
+    assert ip_to_int("192.168.2.1") not in table
+    assert ip_to_int("2001:db9::1") not in table
+
+
+def test_subnet_table_overlapping_and_host_networks():
+    """Test nested networks, single hosts and non-strict network addresses."""
+    table = SubnetTable(["172.16.0.0/12", "172.16.5.0/24", "203.0.113.7/32", "198.51.100.9/24"])
+
+    assert ip_to_int("172.31.255.255") in table
+    assert ip_to_int("172.16.5.1") in table
+    assert ip_to_int("203.0.113.7") in table
+    assert ip_to_int("203.0.113.8") not in table
+    assert ip_to_int("198.51.100.200") in table
+
+
+def test_subnet_table_ipv4_does_not_match_ipv6_space():
+    """Test that IPv4 networks only match IPv4 (or IPv4-mapped) addresses."""
+    table = SubnetTable(["0.0.0.0/0"])
+
+    assert ip_to_int("8.8.8.8") in table
+    assert ip_to_int("2001:db8::1") not in table
+
+
+def test_subnet_table_skips_invalid_entries():
+    """Test that invalid entries are ignored and lookups of invalid keys fail."""
+    table = SubnetTable(["invalid_subnet", "192.168.1.0/24"])
+
+    assert table
+    assert ip_to_int("192.168.1.1") in table
+    assert None not in table
+    assert not SubnetTable([])
+    assert not SubnetTable(["invalid_subnet"])
+
+
+def test_subnet_table_ipv6_networks_covering_mapped_range():
+    """Test that IPv4 addresses are not matched against IPv6 networks."""
+    table = SubnetTable(["::/0"])
+
+    assert ip_to_int("2001:db8::1") in table
+    assert ip_to_int("8.8.8.8") not in table
+
+
+def test_subnet_table_with_hosts():
+    """Test that added host addresses match exactly and leave the original table unchanged."""
+    table = SubnetTable(["192.168.1.0/24", "10.0.0.5/32"])
+    joint = table.with_hosts([ip_to_int("10.0.0.6"), ip_to_int("2001:db8::1")])
+
+    assert ip_to_int("192.168.1.1") in joint
+    assert ip_to_int("10.0.0.5") in joint
+    assert ip_to_int("10.0.0.6") in joint
+    assert ip_to_int("2001:db8::1") in joint
+    assert ip_to_int("10.0.0.7") not in joint
+    assert ip_to_int("2001:db8::2") not in joint
+
+    assert ip_to_int("10.0.0.6") not in table
+    assert SubnetTable([]).with_hosts([ip_to_int("10.0.0.6")])
@@ -1,28 +1,58 @@
 """Tests for API endpoints."""
 
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 from fastapi.testclient import TestClient
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
 from teamspeak_auth.api import app
+from teamspeak_auth.api import auth as auth_api
+from teamspeak_auth.ts_client import AuthorizedClient
+
+# Address the test client connects from
+CLIENT_IP = "192.168.1.10"
+
+
+@pytest.fixture(autouse=True)
+def clear_forward_auth_caches():
+    """Reset the module-level ForwardAuth decision caches between tests."""
+    auth_api._fa_cache.clear()
+    auth_api._deny_cache.clear()
 
 
 @pytest.fixture
 def client():
     """Create a test client."""
-    return TestClient(app)
+    return TestClient(app, client=(CLIENT_IP, 50000))
+
+
+def proxied_client(trusted_proxy_ips):
+    """Create a test client with proxy header handling as applied by uvicorn."""
+    return TestClient(
+        ProxyHeadersMiddleware(app, trusted_hosts=trusted_proxy_ips), client=(CLIENT_IP, 50000)
+    )
 
 
 @pytest.fixture
 def mock_auth_service():
-    """Create a mock authorization service."""
+    """Create a mock authorization service and install it on the app."""
     mock_service = Mock()
-    mock_service.is_authorized.return_value = False
-    mock_service.get_authorized_user_info.return_value = None
-    mock_service.authorized_ips = {}
+    mock_service.refresh_if_stale = AsyncMock()
+    mock_service.authorize.return_value = (False, None)
+    mock_service.snapshot_version = 0
+    mock_service.authorized_ips = frozenset()
     mock_service.get_cache_age.return_value = 10.5
-    return mock_service
+
+    app.state.auth_service = mock_service
+    yield mock_service
+    del app.state.auth_service
+
+
+def authorize_client(mock_service, nickname, groups=("6",)):
+    """Make the mock service authorize requests as the given TeamSpeak client."""
+    user_info = AuthorizedClient(nickname, tuple(groups), client_id="1", client_db_id="1")
+    mock_service.authorize.return_value = (True, user_info)
 
 
 def test_root_endpoint(client):
@@ -36,126 +66,215 @@ def test_root_endpoint(client):
     assert "/auth" in data["endpoints"]
 
 
+def test_root_endpoint_gzip(client):
+    """Test responses are compressed for clients that accept gzip."""
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.json()["service"] == "TeamSpeak Auth API"
+
+    # The pre-rendered response must not keep the gzip headers for later requests
+    response = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json()["service"] == "TeamSpeak Auth API"
+
+
+def test_auth_endpoint_service_unavailable(client):
+    """Test /auth endpoint returns 503 when the service has not been started."""
+    response = client.get("/auth")
+    assert response.status_code == 503
+
+
 def test_auth_endpoint_unauthorized(client, mock_auth_service):
     """Test /auth endpoint returns 403 for unauthorized IP."""
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.get("/auth")
-        assert response.status_code == 403
-        assert "Forbidden" in response.json()["detail"]
+    response = client.get("/auth")
+    assert response.status_code == 403
+    assert "Forbidden" in response.json()["detail"]
+
+
+def test_auth_endpoint_unauthorized_is_cached(client, mock_auth_service):
+    """Test /auth endpoint reuses a recent deny decision for the same IP."""
+    mock_auth_service.snapshot_version = 1
+
+    assert client.get("/auth").status_code == 403
+    assert client.get("/auth").status_code == 403
+
+    mock_auth_service.authorize.assert_called_once_with(CLIENT_IP)
+
+
+def test_auth_endpoint_refreshes_stale_cache(client, mock_auth_service):
+    """Test /auth endpoint lets the service refresh a stale cache on every request."""
+    mock_auth_service.snapshot_version = 1
+
+    client.get("/auth")
+    client.get("/auth")
+
+    assert mock_auth_service.refresh_if_stale.call_count == 2
+
+
+def test_auth_endpoint_deny_cache_invalidated_on_refresh(client, mock_auth_service):
+    """Test /auth endpoint re-checks a denied IP once a new snapshot is published."""
+    mock_auth_service.snapshot_version = 1
+    assert client.get("/auth").status_code == 403
+
+    mock_auth_service.snapshot_version = 2
+    authorize_client(mock_auth_service, "TestUser")
+
+    response = client.get("/auth")
+    assert response.status_code == 200
+    assert response.json()["user"] == "TestUser"
 
 
 def test_auth_endpoint_authorized(client, mock_auth_service):
     """Test /auth endpoint returns 200 for authorized IP."""
-    mock_auth_service.is_authorized.return_value = True
-    mock_auth_service.get_authorized_user_info.return_value = {
-        "nickname": "TestUser",
-        "groups": ["6"],
-    }
+    authorize_client(mock_auth_service, "TestUser")
 
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.get("/auth")
-        assert response.status_code == 200
+    response = client.get("/auth")
+    assert response.status_code == 200
 
-        data = response.json()
-        assert data["status"] == "authorized"
-        assert data["user"] == "TestUser"
+    data = response.json()
+    assert data["status"] == "authorized"
+    assert data["user"] == "TestUser"
+
+    # Check that X-Auth-User header is set
+    assert "X-Auth-User" in response.headers
+    assert response.headers["X-Auth-User"] == "TestUser"
+
+
+@pytest.mark.parametrize("method", ["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD"])
+def test_auth_endpoint_accepts_any_method(client, mock_auth_service, method):
+    """Test /auth endpoint answers every method a proxied request may use."""
+    authorize_client(mock_auth_service, "TestUser")
+
+    response = client.request(method, "/auth")
+    assert response.status_code == 200
+    assert response.headers["X-Auth-User"] == "TestUser"
 
-        # Check that X-Auth-User header is set
-        assert "X-Auth-User" in response.headers
-        assert response.headers["X-Auth-User"] == "TestUser"
+
+def test_auth_endpoint_cache_invalidated_on_refresh(client, mock_auth_service):
+    """Test /auth does not serve a cached response from a previous snapshot."""
+    mock_auth_service.snapshot_version = 1
+    authorize_client(mock_auth_service, "OldName")
+
+    assert client.get("/auth").headers["X-Auth-User"] == "OldName"
+
+    mock_auth_service.snapshot_version = 2
+    authorize_client(mock_auth_service, "NewName")
+
+    response = client.get("/auth")
+    assert response.status_code == 200
+    assert response.json()["user"] == "NewName"
+    assert response.headers["X-Auth-User"] == "NewName"
 
 
 def test_auth_endpoint_authorized_via_subnet(client, mock_auth_service):
     """Test /auth endpoint returns 200 for subnet-authorized IP with default nickname."""
-    mock_auth_service.is_authorized.return_value = True
-    mock_auth_service.get_authorized_user_info.return_value = None  # No TeamSpeak user info
+    mock_auth_service.authorize.return_value = (True, None)  # No TeamSpeak user info
 
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.get("/auth")
-        assert response.status_code == 200
+    response = client.get("/auth")
+    assert response.status_code == 200
 
-        data = response.json()
-        assert data["status"] == "authorized"
-        assert data["user"] == "localuser"
+    data = response.json()
+    assert data["status"] == "authorized"
+    assert data["user"] == "localuser"
 
-        # Check that X-Auth-User header is set with default nickname
-        assert "X-Auth-User" in response.headers
-        assert response.headers["X-Auth-User"] == "localuser"
+    # Check that X-Auth-User header is set with default nickname
+    assert "X-Auth-User" in response.headers
+    assert response.headers["X-Auth-User"] == "localuser"
 
 
-def test_auth_endpoint_with_x_forwarded_for(client, mock_auth_service):
-    """Test /auth endpoint uses X-Forwarded-For header."""
-    mock_auth_service.is_authorized.return_value = True
-    mock_auth_service.get_authorized_user_info.return_value = {
-        "nickname": "TestUser",
-        "groups": ["6"],
-    }
+def test_auth_endpoint_with_x_forwarded_for(mock_auth_service):
+    """Test /auth endpoint uses X-Forwarded-For header from a trusted proxy."""
+    client = proxied_client("*")
+    authorize_client(mock_auth_service, "TestUser")
 
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.get("/auth", headers={"X-Forwarded-For": "192.168.1.100"})
-        assert response.status_code == 200
+    response = client.get("/auth", headers={"X-Forwarded-For": "192.168.1.100"})
+    assert response.status_code == 200
 
-        # Verify the service was called with the forwarded IP
-        mock_auth_service.is_authorized.assert_called_with("192.168.1.100")
+    # Verify the forwarded IP was the one checked
+    assert response.json()["ip"] == "192.168.1.100"
+    assert response.json()["user"] == "TestUser"
+    mock_auth_service.authorize.assert_called_once_with("192.168.1.100")
+
+
+def test_auth_endpoint_with_multi_hop_x_forwarded_for(mock_auth_service):
+    """Test /auth endpoint uses the first address of a multi-hop X-Forwarded-For."""
+    client = proxied_client("*")
+    authorize_client(mock_auth_service, "TestUser")
+
+    response = client.get("/auth", headers={"X-Forwarded-For": "192.168.1.100, 10.0.0.1, 10.0.0.2"})
+    assert response.status_code == 200
+    assert response.json()["ip"] == "192.168.1.100"
+    mock_auth_service.authorize.assert_called_once_with("192.168.1.100")
+
+
+def test_auth_endpoint_ignores_x_forwarded_for_from_untrusted_proxy(mock_auth_service):
+    """Test /auth endpoint ignores X-Forwarded-For from a proxy that is not trusted."""
+    client = proxied_client("10.0.0.1")
+
+    response = client.get("/auth", headers={"X-Forwarded-For": "192.168.1.100"})
+    assert response.status_code == 403
+    mock_auth_service.authorize.assert_called_once_with(CLIENT_IP)
 
 
 def test_auth_check_endpoint(client, mock_auth_service):
     """Test /auth/check endpoint returns authorization status."""
-    mock_auth_service.is_authorized.return_value = False
-
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.get("/auth/check")
-        assert response.status_code == 200
+    response = client.get("/auth/check")
+    assert response.status_code == 200
 
-        data = response.json()
-        assert data["authorized"] is False
-        assert "ip_address" in data
+    data = response.json()
+    assert data["authorized"] is False
+    assert data["ip_address"] == CLIENT_IP
+    mock_auth_service.authorize.assert_called_once_with(CLIENT_IP)
 
 
 def test_auth_check_by_ip_endpoint(client, mock_auth_service):
     """Test /auth/check/{ip} endpoint checks specific IP."""
-    mock_auth_service.is_authorized.return_value = True
-    mock_auth_service.get_authorized_user_info.return_value = {
-        "nickname": "TestUser",
-        "groups": ["6", "9"],
-    }
+    authorize_client(mock_auth_service, "TestUser", ("6", "9"))
 
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.get("/auth/check/192.168.1.50")
-        assert response.status_code == 200
+    response = client.get("/auth/check/192.168.1.50")
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["authorized"] is True
+    assert data["ip_address"] == "192.168.1.50"
+    assert data["user_info"]["nickname"] == "TestUser"
+    assert data["user_info"]["groups"] == ["6", "9"]
+    mock_auth_service.authorize.assert_called_once_with("192.168.1.50")
 
-        data = response.json()
-        assert data["authorized"] is True
-        assert data["ip_address"] == "192.168.1.50"
-        assert data["user_info"]["nickname"] == "TestUser"
+
+def test_auth_refresh_endpoint(client, mock_auth_service):
+    """Test /auth/refresh schedules a background refresh and returns immediately."""
+    response = client.post("/auth/refresh")
+    assert response.status_code == 202
+
+    data = response.json()
+    assert data["status"] == "scheduled"
+    assert data["authorized_users_count"] == 0
+    mock_auth_service.schedule_update.assert_called_once()
 
 
 def test_status_endpoint(client, mock_auth_service):
     """Test /status endpoint returns service status."""
-    mock_auth_service.authorized_ips = {"192.168.1.1": {}, "192.168.1.2": {}}
+    mock_auth_service.authorized_ips = frozenset({"192.168.1.1", "192.168.1.2"})
     mock_auth_service.get_cache_age.return_value = 15.3
 
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        with patch("teamspeak_auth.api.status.config") as mock_config:
-            mock_config.cache_ttl = 30
+    with patch("teamspeak_auth.api.status.config") as mock_config:
+        mock_config.cache_ttl = 30
 
-            response = client.get("/status")
-            assert response.status_code == 200
+        response = client.get("/status")
+        assert response.status_code == 200
 
-            data = response.json()
-            assert data["status"] == "running"
-            assert data["authorized_users_count"] == 2
-            assert data["cache_age_seconds"] == 15.3
-            assert data["cache_ttl_seconds"] == 30
+        data = response.json()
+        assert data["status"] == "running"
+        assert data["authorized_users_count"] == 2
+        assert data["cache_age_seconds"] == 15.3
+        assert data["cache_ttl_seconds"] == 30
 
 
 def test_ome_admission_opening_authorized(client, mock_auth_service):
     """Test OME admission webhook allows authorized IP."""
-    mock_auth_service.is_authorized.return_value = True
-    mock_auth_service.get_authorized_user_info.return_value = {
-        "nickname": "TestUser",
-        "groups": ["6"],
-    }
+    authorize_client(mock_auth_service, "TestUser")
 
     payload = {
         "client": {
@@ -171,19 +290,17 @@ def test_ome_admission_opening_authorized(client, mock_auth_service):
         },
     }
 
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.post("/ome/admission", json=payload)
-        assert response.status_code == 200
+    response = client.post("/ome/admission", json=payload)
+    assert response.status_code == 200
 
-        data = response.json()
-        assert data["allowed"] is True
-        assert data["lifetime"] == 0
+    data = response.json()
+    assert data["allowed"] is True
+    assert data["lifetime"] == 0
+    mock_auth_service.authorize.assert_called_once_with("192.168.1.100")
 
 
 def test_ome_admission_opening_unauthorized(client, mock_auth_service):
     """Test OME admission webhook rejects unauthorized IP."""
-    mock_auth_service.is_authorized.return_value = False
-
     payload = {
         "client": {
             "address": "192.168.1.200",
@@ -198,13 +315,13 @@ def test_ome_admission_opening_unauthorized(client, mock_auth_service):
         },
     }
 
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.post("/ome/admission", json=payload)
-        assert response.status_code == 200
+    response = client.post("/ome/admission", json=payload)
+    assert response.status_code == 200
 
-        data = response.json()
-        assert data["allowed"] is False
-        assert data["reason"] == "IP address not authorized"
+    data = response.json()
+    assert data["allowed"] is False
+    assert data["reason"] == "IP address not authorized"
+    mock_auth_service.authorize.assert_called_once_with("192.168.1.200")
 
 
 def test_ome_admission_closing(client, mock_auth_service):
@@ -223,18 +340,16 @@ def test_ome_admission_closing(client, mock_auth_service):
         },
     }
 
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.post("/ome/admission", json=payload)
-        assert response.status_code == 200
+    response = client.post("/ome/admission", json=payload)
+    assert response.status_code == 200
 
-        data = response.json()
-        assert data == {}
+    data = response.json()
+    assert data == {}
 
 
 def test_ome_admission_uses_real_ip(client, mock_auth_service):
     """Test OME admission webhook uses real_ip when available."""
-    mock_auth_service.is_authorized.return_value = True
-    mock_auth_service.get_authorized_user_info.return_value = None
+    mock_auth_service.authorize.return_value = (True, None)
 
     payload = {
         "client": {
@@ -251,9 +366,34 @@ def test_ome_admission_uses_real_ip(client, mock_auth_service):
         },
     }
 
-    with patch("teamspeak_auth.api.dependencies.auth_service", mock_auth_service):
-        response = client.post("/ome/admission", json=payload)
-        assert response.status_code == 200
+    response = client.post("/ome/admission", json=payload)
+    assert response.status_code == 200
+
+    # Verify authorization was checked for real_ip, not address
+    mock_auth_service.authorize.assert_called_once_with("192.168.1.100")
+
+
+def test_ome_admission_closing_skips_validation(client, mock_auth_service):
+    """Test OME admission webhook accepts closing events without a full payload."""
+    payload = {"request": {"status": "closing"}}
+
+    response = client.post("/ome/admission", json=payload)
+    assert response.status_code == 200
+    assert response.json() == {}
+
+
+def test_ome_admission_opening_invalid_payload(client, mock_auth_service):
+    """Test OME admission webhook rejects malformed opening events."""
+    payload = {"request": {"status": "opening"}}
+
+    response = client.post("/ome/admission", json=payload)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][0] == "body"
+
 
-        # Verify is_authorized was called with real_ip, not address
-        mock_auth_service.is_authorized.assert_called_with("192.168.1.100")
+def test_ome_admission_invalid_json(client, mock_auth_service):
+    """Test OME admission webhook rejects bodies that are not JSON."""
+    response = client.post(
+        "/ome/admission", content=b"not json", headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == 422
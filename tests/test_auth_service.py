@@ -1,37 +1,63 @@
 """Tests for authorization service."""
 
-from unittest.mock import Mock, patch
+import asyncio
+import time
+from unittest.mock import AsyncMock
 
 import pytest
 
+from teamspeak_auth import auth_service
 from teamspeak_auth.auth_service import AuthorizationService
+from teamspeak_auth.ts_client import AuthorizedClient
+
+
+def make_client(nickname, groups=("6",)):
+    """Create an authorized TeamSpeak client record."""
+    return AuthorizedClient(nickname, tuple(groups), client_id="1", client_db_id="1")
+
+
+def _override_config(monkeypatch, **values):
+    """Swap the config seen by new services for a copy with the given values."""
+    monkeypatch.setattr(auth_service, "config", auth_service.config.model_copy(update=values))
+
+
+@pytest.fixture
+def subnets(monkeypatch):
+    """Return a setter overriding the authorized subnets seen by new services."""
+
+    def _set(value):
+        _override_config(monkeypatch, authorized_subnets=value)
+
+    return _set
 
 
 @pytest.fixture
-def mock_ts_client():
-    """Create a mock TeamSpeak client."""
-    mock_client = Mock()
-    mock_client.connection = None
-    return mock_client
+def cache_ttl(monkeypatch):
+    """Return a setter overriding the cache TTL seen by new services."""
+
+    def _set(value):
+        _override_config(monkeypatch, cache_ttl=value)
+
+    return _set
 
 
 def test_authorization_service_init():
     """Test that AuthorizationService initializes correctly."""
     service = AuthorizationService()
 
-    assert service.authorized_ips == {}
+    assert service.authorized_ips == frozenset()
+    assert service.snapshot.clients == {}
+    assert service.snapshot_version == 0
     assert service.last_update == 0
     assert service.ts_client is not None
 
 
-@patch("teamspeak_auth.auth_service.config")
-def test_is_authorized_returns_false_for_unknown_ip(mock_config):
+def test_is_authorized_returns_false_for_unknown_ip(subnets):
     """Test that is_authorized returns False for unknown IPs."""
-    # Mock config to have no authorized subnets
-    mock_config.authorized_subnets = []
+    subnets([])
 
     service = AuthorizationService()
-    service.authorized_ips = {"192.168.1.100": {"nickname": "User1"}}
+    service.set_authorized_clients({"192.168.1.100": make_client("User1")})
 
     assert service.is_authorized("192.168.1.200") is False
 
@@ -39,29 +65,47 @@ def test_is_authorized_returns_false_for_unknown_ip(mock_config):
 def test_is_authorized_returns_true_for_known_ip():
     """Test that is_authorized returns True for authorized IPs."""
     service = AuthorizationService()
-    service.authorized_ips = {"192.168.1.100": {"nickname": "User1"}}
+    service.set_authorized_clients({"192.168.1.100": make_client("User1")})
 
     assert service.is_authorized("192.168.1.100") is True
 
 
+def test_is_authorized_matches_ipv4_mapped_ipv6():
+    """Test that an IPv4 client also matches its IPv4-mapped IPv6 spelling."""
+    service = AuthorizationService()
+    service.set_authorized_clients({"192.168.1.100": make_client("User1")})
+
+    assert service.is_authorized("::ffff:192.168.1.100") is True
+    assert service.get_authorized_user_info("::ffff:192.168.1.100") == make_client("User1")
+
+
 def test_get_authorized_user_info():
     """Test getting user info for authorized IP."""
     service = AuthorizationService()
-    user_data = {
-        "nickname": "TestUser",
-        "groups": ["6", "9"],
-        "client_id": "123",
-    }
-    service.authorized_ips = {"192.168.1.100": user_data}
+    user_data = AuthorizedClient(
+        nickname="TestUser", groups=("6", "9"), client_id="123", client_db_id="45"
+    )
+    service.set_authorized_clients({"192.168.1.100": user_data})
 
     result = service.get_authorized_user_info("192.168.1.100")
     assert result == user_data
 
 
+def test_set_authorized_clients_bumps_snapshot_version():
+    """Test that publishing new clients bumps the snapshot version."""
+    service = AuthorizationService()
+    version = service.snapshot_version
+
+    service.set_authorized_clients({"192.168.1.100": make_client("User1")})
+
+    assert service.snapshot_version == version + 1
+    assert service.authorized_ips == frozenset({"192.168.1.100"})
+
+
 def test_get_authorized_user_info_returns_none_for_unknown():
     """Test that get_authorized_user_info returns None for unknown IPs."""
     service = AuthorizationService()
-    service.authorized_ips = {}
+    service.set_authorized_clients({})
 
     result = service.get_authorized_user_info("192.168.1.100")
     assert result is None
@@ -70,37 +114,47 @@ def test_get_authorized_user_info_returns_none_for_unknown():
 def test_get_all_authorized_ips():
     """Test getting list of all authorized IPs."""
     service = AuthorizationService()
-    service.authorized_ips = {
-        "192.168.1.100": {"nickname": "User1"},
-        "192.168.1.101": {"nickname": "User2"},
-    }
+    service.set_authorized_clients(
+        {
+            "192.168.1.100": make_client("User1"),
+            "192.168.1.101": make_client("User2"),
+        }
+    )
 
     ips = service.get_all_authorized_ips()
     assert len(ips) == 2
     assert "192.168.1.100" in ips
     assert "192.168.1.101" in ips
+    assert service.get_all_authorized_ips() is ips
+
+
+def test_invalid_client_ips_are_not_listed():
+    """Test that clients with an invalid IP address are left out of the authorized IPs."""
+    service = AuthorizationService()
+    service.set_authorized_clients(
+        {"192.168.1.100": make_client("User1"), "not-an-ip": make_client("User2")}
+    )
+
+    assert service.authorized_ips == frozenset({"192.168.1.100"})
+    assert service.get_all_authorized_ips() == ("192.168.1.100",)
 
 
 def test_get_cache_age():
     """Test getting cache age."""
-    import time
-
     service = AuthorizationService()
-    service.last_update = time.time() - 10.5
+    service.last_update = time.monotonic() - 10.5
 
     age = service.get_cache_age()
     assert age >= 10.5
     assert age < 11.0  # Should be close to 10.5
 
 
-@patch("teamspeak_auth.auth_service.config")
-def test_is_authorized_via_subnet(mock_config):
+def test_is_authorized_via_subnet(subnets):
     """Test that IPs in authorized subnets are authorized."""
-    # Mock config to have authorized subnets
-    mock_config.authorized_subnets = ["192.168.1.0/24", "10.0.0.0/8"]
+    subnets(["192.168.1.0/24", "10.0.0.0/8"])
 
     service = AuthorizationService()
-    service.authorized_ips = {}  # No TeamSpeak authorized IPs
+    service.set_authorized_clients({})  # No TeamSpeak authorized IPs
 
     # IP in first subnet should be authorized
     assert service.is_authorized("192.168.1.100") is True
@@ -110,14 +164,12 @@ def test_is_authorized_via_subnet(mock_config):
     assert service.is_authorized("172.16.0.1") is False
 
 
-@patch("teamspeak_auth.auth_service.config")
-def test_is_authorized_subnet_takes_precedence(mock_config):
+def test_is_authorized_subnet_takes_precedence(subnets):
     """Test that subnet authorization is checked before TeamSpeak authorization."""
-    # Mock config to have authorized subnets
-    mock_config.authorized_subnets = ["192.168.1.0/24"]
+    subnets(["192.168.1.0/24"])
 
     service = AuthorizationService()
-    service.authorized_ips = {"10.0.0.1": {"nickname": "User1"}}
+    service.set_authorized_clients({"10.0.0.1": make_client("User1")})
 
     # IP in subnet should be authorized even if not in TeamSpeak list
     assert service.is_authorized("192.168.1.50") is True
@@ -125,16 +177,215 @@ def test_is_authorized_subnet_takes_precedence(mock_config):
     assert service.is_authorized("10.0.0.1") is True
 
 
-@patch("teamspeak_auth.auth_service.config")
-def test_is_authorized_with_invalid_subnet_config(mock_config):
+def test_authorize_returns_client_info(subnets):
+    """Test that authorize returns the decision together with the TeamSpeak client."""
+    subnets(["192.168.1.0/24"])
+
+    service = AuthorizationService()
+    service.set_authorized_clients(
+        {"10.0.0.1": make_client("User1"), "192.168.1.60": make_client("User2")}
+    )
+
+    assert service.authorize("10.0.0.1") == (True, make_client("User1"))
+    assert service.authorize("192.168.1.60") == (True, make_client("User2"))
+    assert service.authorize("192.168.1.50") == (True, None)
+    assert service.authorize("10.0.0.2") == (False, None)
+    assert service.authorize("not-an-ip") == (False, None)
+
+
+def test_is_authorized_with_invalid_subnet_config(subnets):
     """Test that invalid subnet configurations are handled gracefully."""
-    # Mock config with an invalid subnet
-    mock_config.authorized_subnets = ["invalid_subnet", "192.168.1.0/24"]
+    # Configure an invalid subnet
+    subnets(["invalid_subnet", "192.168.1.0/24"])
 
     service = AuthorizationService()
-    service.authorized_ips = {}
+    service.set_authorized_clients({})
 
     # Valid subnet should still work despite invalid one
     assert service.is_authorized("192.168.1.100") is True
     # IP not in valid subnet should not be authorized
     assert service.is_authorized("10.0.0.1") is False
+
+
+@pytest.mark.asyncio
+async def test_schedule_update_coalesces_concurrent_calls():
+    """Test that scheduling while an update is in flight does not start another."""
+    service = AuthorizationService()
+    release = asyncio.Event()
+    calls = 0
+
+    async def fake_update():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+
+    service.update_authorized_users = fake_update
+
+    service.schedule_update()
+    service.schedule_update()
+    await asyncio.sleep(0)
+    release.set()
+    await service._refresh_task
+
+    assert calls == 1
+
+    # Once finished, a new call schedules a fresh update
+    service.schedule_update()
+    await service._refresh_task
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_if_stale_schedules_once_per_ttl(cache_ttl):
+    """Test that a stale cache schedules one update until the TTL elapses again."""
+    cache_ttl(30)
+    service = AuthorizationService()
+    calls = 0
+
+    async def fake_update():
+        nonlocal calls
+        calls += 1
+
+    service.update_authorized_users = fake_update
+    service.last_update = time.monotonic() - 31
+
+    await service.refresh_if_stale()
+    await service._refresh_task
+    await service.refresh_if_stale()
+
+    assert calls == 1
+    assert service._refresh_task.done()
+
+
+@pytest.mark.asyncio
+async def test_refresh_if_stale_waits_for_update_past_twice_the_ttl(cache_ttl):
+    """Test that a cache older than twice the TTL is refreshed before it is used."""
+    cache_ttl(30)
+    service = AuthorizationService()
+    service.set_authorized_clients({"192.168.1.100": make_client("User1")})
+    service.last_update = time.monotonic() - 3600
+
+    async def fake_update():
+        # User1 has left the server since the last update
+        service.set_authorized_clients({"192.168.1.101": make_client("User2")})
+        service.last_update = time.monotonic()
+
+    service.update_authorized_users = fake_update
+
+    await service.refresh_if_stale()
+
+    assert service.is_authorized("192.168.1.100") is False
+    assert service.is_authorized("192.168.1.101") is True
+
+
+@pytest.mark.asyncio
+async def test_refresh_if_stale_drops_expired_clients_when_update_fails(subnets):
+    """Test that an expired cache is not used to authorize if it cannot be refreshed."""
+    subnets(["10.0.0.0/8"])
+    service = AuthorizationService()
+    service.set_authorized_clients({"192.168.1.100": make_client("User1")})
+    service.last_update = time.monotonic() - 3600
+    calls = 0
+
+    async def failed_update():
+        nonlocal calls
+        calls += 1
+
+    service.update_authorized_users = failed_update
+
+    await service.refresh_if_stale()
+    await service.refresh_if_stale()
+
+    assert calls == 1
+    assert service.is_authorized("192.168.1.100") is False
+    assert service.is_authorized("10.0.0.1") is True
+
+
+@pytest.mark.asyncio
+async def test_refresh_if_stale_drops_expired_clients_after_failed_background_update(cache_ttl):
+    """Test that a failed background update does not extend the life of the cache."""
+    cache_ttl(30)
+    service = AuthorizationService()
+    service.set_authorized_clients({"192.168.1.100": make_client("User1")})
+    service.last_update = time.monotonic() - 59
+    calls = 0
+
+    async def failed_update():
+        nonlocal calls
+        calls += 1
+
+    service.update_authorized_users = failed_update
+
+    # Stale but not expired: the update runs in the background and fails
+    await service.refresh_if_stale()
+    await service._refresh_task
+    assert service.is_authorized("192.168.1.100") is True
+
+    # 80s old, before the next update is due
+    service.last_update -= 21
+    await service.refresh_if_stale()
+
+    assert calls == 1
+    assert service.is_authorized("192.168.1.100") is False
+
+
+@pytest.mark.asyncio
+async def test_refresh_if_stale_bounds_wait_for_update(monkeypatch):
+    """Test that a request stops waiting for a hanging update and drops expired clients."""
+    monkeypatch.setattr(auth_service, "_MAX_UPDATE_WAIT", 0.01)
+    service = AuthorizationService()
+    service.set_authorized_clients({"192.168.1.100": make_client("User1")})
+    service.last_update = time.monotonic() - 3600
+    release = asyncio.Event()
+
+    async def hanging_update():
+        await release.wait()
+
+    service.update_authorized_users = hanging_update
+
+    await service.refresh_if_stale()
+
+    assert service.is_authorized("192.168.1.100") is False
+
+
+@pytest.mark.asyncio
+async def test_fetch_reconnects_after_dropped_connection():
+    """Test that a dropped ServerQuery connection is reopened and the query retried."""
+    service = AuthorizationService()
+    service.ts_client = AsyncMock()
+    service.ts_client.connection = object()
+    service.ts_client.get_authorized_clients.side_effect = [
+        ConnectionError("closed by server"),
+        {"192.168.1.100": make_client("User1")},
+    ]
+
+    clients = await service._fetch_authorized_clients()
+
+    assert clients == {"192.168.1.100": make_client("User1")}
+    service.ts_client.disconnect.assert_awaited_once()
+    service.ts_client.connect.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_updates_share_one_fetch():
+    """Test that an update requested while another is in flight rides along with it."""
+    service = AuthorizationService()
+    release = asyncio.Event()
+    calls = 0
+
+    async def fake_fetch():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"192.168.1.100": make_client("User1")}
+
+    service._fetch_authorized_clients = fake_fetch
+
+    first = asyncio.create_task(service.update_authorized_users())
+    second = asyncio.create_task(service.update_authorized_users())
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, second)
+
+    assert calls == 1
+    assert service.is_authorized("192.168.1.100") is True
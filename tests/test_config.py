@@ -1,26 +1,13 @@
 """Tests for configuration module."""
 
+import pytest
+from pydantic import ValidationError
+
 from teamspeak_auth.config import Config
 
 
-def test_config_default_values(monkeypatch):
+def test_config_default_values():
     """Test that config loads with default values."""
-    # Clear all environment variables that could affect the config
-    env_vars = [
-        "TS_HOST",
-        "TS_PORT",
-        "TS_USER",
-        "TS_PASSWORD",
-        "TS_SERVER_ID",
-        "REQUIRED_SERVER_GROUPS",
-        "API_HOST",
-        "API_PORT",
-        "CACHE_TTL",
-        "AUTHORIZED_SUBNETS",
-    ]
-    for var in env_vars:
-        monkeypatch.delenv(var, raising=False)
-
     config = Config(_env_file=None)  # Don't load .env for this test
 
     assert config.ts_host == "localhost"
@@ -29,33 +16,32 @@ def test_config_default_values(monkeypatch):
     assert config.ts_server_id == 1
     assert config.api_host == "0.0.0.0"
     assert config.api_port == 8000
+    assert config.api_workers == 1
+    assert config.trusted_proxy_ips == "*"
+    assert config.api_thread_limit == 200
     assert config.cache_ttl == 30
+    assert config.ip_cache_size == 4096
 
 
-def test_config_required_server_groups_parsing(monkeypatch):
+def test_config_required_server_groups_parsing():
     """Test that REQUIRED_SERVER_GROUPS is parsed correctly."""
-    # Clear environment variables
-    env_vars = [
-        "TS_HOST",
-        "TS_PORT",
-        "TS_USER",
-        "TS_PASSWORD",
-        "TS_SERVER_ID",
-        "REQUIRED_SERVER_GROUPS",
-        "API_HOST",
-        "API_PORT",
-        "CACHE_TTL",
-        "AUTHORIZED_SUBNETS",
-    ]
-    for var in env_vars:
-        monkeypatch.delenv(var, raising=False)
-
     config = Config(_env_file=None)
 
     # Should be parsed from string to list of ints
     assert isinstance(config.required_server_groups, list)
     assert all(isinstance(x, int) for x in config.required_server_groups)
     assert config.required_server_groups == [6, 9]
+    assert config.required_server_group_ids == frozenset({"6", "9"})
+
+
+def test_config_required_server_group_ids_follow_model_copy():
+    """Test that a copy with other groups does not report the original group IDs."""
+    config = Config(_env_file=None)
+    assert config.required_server_group_ids == frozenset({"6", "9"})
+
+    copy = config.model_copy(update={"required_server_groups": [1, 2]})
+
+    assert copy.required_server_group_ids == frozenset({"1", "2"})
 
 
 def test_config_custom_values():
@@ -82,24 +68,8 @@ def test_config_server_groups_from_string():
     assert config.required_server_groups == [10, 20, 30]
 
 
-def test_config_authorized_subnets_parsing(monkeypatch):
+def test_config_authorized_subnets_parsing():
     """Test that AUTHORIZED_SUBNETS is parsed correctly."""
-    # Clear environment variables
-    env_vars = [
-        "TS_HOST",
-        "TS_PORT",
-        "TS_USER",
-        "TS_PASSWORD",
-        "TS_SERVER_ID",
-        "REQUIRED_SERVER_GROUPS",
-        "API_HOST",
-        "API_PORT",
-        "CACHE_TTL",
-        "AUTHORIZED_SUBNETS",
-    ]
-    for var in env_vars:
-        monkeypatch.delenv(var, raising=False)
-
     config = Config(_env_file=None, authorized_subnets="192.168.1.0/24,10.0.0.0/8")
 
     # Should be parsed from string to list of strings
@@ -108,24 +78,16 @@ def test_config_authorized_subnets_parsing(monkeypatch):
     assert config.authorized_subnets == ["192.168.1.0/24", "10.0.0.0/8"]
 
 
-def test_config_authorized_subnets_empty(monkeypatch):
+def test_config_authorized_subnets_empty():
     """Test that empty AUTHORIZED_SUBNETS results in empty list."""
-    # Clear environment variables
-    env_vars = [
-        "TS_HOST",
-        "TS_PORT",
-        "TS_USER",
-        "TS_PASSWORD",
-        "TS_SERVER_ID",
-        "REQUIRED_SERVER_GROUPS",
-        "API_HOST",
-        "API_PORT",
-        "CACHE_TTL",
-        "AUTHORIZED_SUBNETS",
-    ]
-    for var in env_vars:
-        monkeypatch.delenv(var, raising=False)
-
     config = Config(_env_file=None, authorized_subnets="")
 
     assert config.authorized_subnets == []
+
+
+def test_config_is_frozen():
+    """Test that settings cannot be changed after loading."""
+    config = Config(_env_file=None)
+
+    with pytest.raises(ValidationError):
+        config.cache_ttl = 60
@@ -0,0 +1,152 @@
+"""Tests for the asyncio ServerQuery client."""
+
+import asyncio
+
+import pytest
+
+from teamspeak_auth.serverquery import (
+    ServerQueryConnection,
+    ServerQueryError,
+    build_command,
+    escape,
+    parse_response,
+    unescape,
+)
+
+
+def test_escape_round_trip():
+    """Test that escaping and unescaping restore the original value."""
+    value = "Foo Bar|baz/qux\\\n\t"
+    escaped = escape(value)
+
+    assert " " not in escaped
+    assert "|" not in escaped
+    assert unescape(escaped) == value
+
+
+def test_build_command():
+    """Test that parameters are escaped and options prefixed."""
+    assert build_command("clientlist", "ip", "groups") == "clientlist -ip -groups"
+    assert (
+        build_command("login", client_login_name="server admin", client_login_password="p|w")
+        == r"login client_login_name=server\sadmin client_login_password=p\pw"
+    )
+
+
+def test_parse_response():
+    """Test parsing records, escaped values and bare flags."""
+    records = parse_response(r"clid=1 client_nickname=Foo\sBar|clid=2 client_nickname=Baz flag")
+
+    assert records == [
+        {"clid": "1", "client_nickname": "Foo Bar"},
+        {"clid": "2", "client_nickname": "Baz", "flag": ""},
+    ]
+    assert parse_response("") == []
+
+
+async def _serve(responses: dict[str, str]):
+    """Start a fake ServerQuery server answering commands from a mapping."""
+    received = []
+
+    async def handle(reader, writer):
+        writer.write(b"TS3\n\rWelcome to the TeamSpeak 3 ServerQuery interface\n\r")
+        while line := await reader.readline():
+            command = line.decode().strip()
+            received.append(command)
+            if command == "quit":
+                break
+            writer.write(responses[command].encode())
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1], received
+
+
+@pytest.mark.asyncio
+async def test_query_returns_records():
+    """Test a command round-trip against a fake server."""
+    server, port, received = await _serve(
+        {
+            "clientlist -ip": (
+                "clid=1 client_nickname=Foo\\sBar connection_client_ip=10.0.0.1"
+                "|clid=2 client_nickname=Baz connection_client_ip=10.0.0.2\n\r"
+                "error id=0 msg=ok\n\r"
+            ),
+            "use sid=1": "error id=0 msg=ok\n\r",
+        }
+    )
+    async with server:
+        connection = await ServerQueryConnection.open("127.0.0.1", port)
+
+        assert await connection.query("use", sid=1) == []
+        clients = await connection.query("clientlist", "ip")
+        await connection.close()
+
+    assert [client["client_nickname"] for client in clients] == ["Foo Bar", "Baz"]
+    assert received[:2] == ["use sid=1", "clientlist -ip"]
+
+
+@pytest.mark.asyncio
+async def test_query_raises_server_errors():
+    """Test that a non-zero error id raises ServerQueryError."""
+    server, port, _ = await _serve(
+        {"login": "error id=520 msg=invalid\\sloginname\\sor\\spassword\n\r"}
+    )
+    async with server:
+        connection = await ServerQueryConnection.open("127.0.0.1", port)
+
+        with pytest.raises(ServerQueryError) as exc_info:
+            await connection.query("login")
+        await connection.close()
+
+    assert exc_info.value.error_id == 520
+    assert exc_info.value.message == "invalid loginname or password"
+
+
+@pytest.mark.asyncio
+async def test_pipeline_keeps_responses_in_order():
+    """Test that pipelined responses are matched in order, even after an error."""
+    server, port, received = await _serve(
+        {
+            "use sid=1": "error id=0 msg=ok\n\r",
+            "use sid=2": "error id=1024 msg=invalid\\sserverID\n\r",
+            "whoami": "virtualserver_id=1\n\rerror id=0 msg=ok\n\r",
+        }
+    )
+    async with server:
+        connection = await ServerQueryConnection.open("127.0.0.1", port)
+
+        assert await connection.pipeline("use sid=1", "whoami") == [
+            [],
+            [{"virtualserver_id": "1"}],
+        ]
+        with pytest.raises(ServerQueryError):
+            await connection.pipeline("use sid=2", "whoami")
+        assert await connection.query("whoami") == [{"virtualserver_id": "1"}]
+        await connection.close()
+
+    assert received[:5] == ["use sid=1", "whoami", "use sid=2", "whoami", "whoami"]
+
+
+@pytest.mark.asyncio
+async def test_timeout_closes_connection():
+    """Test that a timed out command leaves the connection unusable instead of out of sync."""
+    server, port, received = await _serve(
+        {
+            # Never answered, so the reply arrives after the timeout at the earliest
+            "clientlist": "",
+            "whoami": "virtualserver_id=1\n\rerror id=0 msg=ok\n\r",
+        }
+    )
+    async with server:
+        connection = await ServerQueryConnection.open("127.0.0.1", port, timeout=0.1)
+
+        with pytest.raises(TimeoutError):
+            await connection.query("clientlist")
+        with pytest.raises(ConnectionError):
+            await connection.query("whoami")
+        await connection.close()
+
+    assert received[:1] == ["clientlist"]
+    assert "whoami" not in received
@@ -0,0 +1,98 @@
+"""Tests for the TeamSpeak client."""
+
+import pytest
+
+from teamspeak_auth.ts_client import AuthorizedClient, TeamSpeakClient
+
+
+class _FakeConnection:
+    """Stand-in for ServerQueryConnection answering clientlist with fixed records."""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.queries = []
+
+    async def query(self, command, *options, **params):
+        self.queries.append((command, *options))
+        return self.clients
+
+
+def _client_record(clid, nickname, ip, groups, client_type="0", db_id=None):
+    """Build a clientlist -ip -groups record as parsed from the server response."""
+    record = {
+        "clid": clid,
+        "client_database_id": db_id if db_id is not None else f"10{clid}",
+        "client_nickname": nickname,
+        "client_type": client_type,
+        "client_servergroups": groups,
+    }
+    if ip is not None:
+        record["connection_client_ip"] = ip
+    return record
+
+
+@pytest.fixture
+def ts_client():
+    """Create a TeamSpeak client requiring server group 6 or 9."""
+    client = TeamSpeakClient()
+    client._required_groups = frozenset({"6", "9"})
+    return client
+
+
+@pytest.mark.asyncio
+async def test_get_authorized_clients_filters_by_server_group(ts_client):
+    """Test that only clients in one of the required groups are authorized."""
+    ts_client.connection = _FakeConnection(
+        [
+            _client_record("1", "Member", "10.0.0.1", "8,9"),
+            _client_record("2", "Guest", "10.0.0.2", "8"),
+            _client_record("3", "NoGroups", "10.0.0.3", ""),
+        ]
+    )
+
+    clients = await ts_client.get_authorized_clients()
+
+    assert clients == {
+        "10.0.0.1": AuthorizedClient(
+            nickname="Member", groups=("8", "9"), client_id="1", client_db_id="101"
+        )
+    }
+    assert ts_client.connection.queries == [("clientlist", "ip", "groups")]
+
+
+@pytest.mark.asyncio
+async def test_get_authorized_clients_skips_query_clients(ts_client):
+    """Test that ServerQuery clients are ignored even if they hold a required group."""
+    ts_client.connection = _FakeConnection(
+        [
+            _client_record("1", "serveradmin", "127.0.0.1", "6", client_type="1"),
+            _client_record("2", "Member", "10.0.0.2", "6"),
+        ]
+    )
+
+    clients = await ts_client.get_authorized_clients()
+
+    assert list(clients) == ["10.0.0.2"]
+
+
+@pytest.mark.asyncio
+async def test_get_authorized_clients_skips_incomplete_records(ts_client):
+    """Test that clients without an IP address or database ID are skipped."""
+    ts_client.connection = _FakeConnection(
+        [
+            _client_record("1", "NoIP", None, "6"),
+            _client_record("2", "NoDbId", "10.0.0.2", "6", db_id=""),
+            _client_record("3", "Member", "10.0.0.3", "6"),
+        ]
+    )
+
+    clients = await ts_client.get_authorized_clients()
+
+    assert list(clients) == ["10.0.0.3"]
+
+
+@pytest.mark.asyncio
+async def test_get_connected_clients_requires_connection(ts_client):
+    """Test that querying without a connection raises RuntimeError."""
+    with pytest.raises(RuntimeError):
+        await ts_client.get_connected_clients()